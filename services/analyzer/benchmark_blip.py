@@ -0,0 +1,107 @@
+# benchmark_blip.py - Compare BLIP decode profiles and quantization
+"""Latency per frame of each BLIP decode profile (fp32 and int8) and how often the
+resulting scene category/action agree with the reference (beam5, fp32).
+
+Only category and action feed into highlight selection, so a profile with full
+agreement can replace beam5 without changing which scenes are picked. Run inside
+the analyzer container, e.g.:
+
+    python benchmark_blip.py /app/videos/uploads/example.mp4 --frames 48 --threads 4
+    python benchmark_blip.py frame1.jpg frame2.jpg --profiles greedy greedy-capped --no-int8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import cv2
+
+import visual_analysis
+from visual_analysis import VisualAnalyzer, BLIP_DECODE_PROFILES
+
+REFERENCE_PROFILE = "beam5"
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi', '.webm')
+
+def load_frames(paths, frames_per_video):
+    """Images as-is, videos as evenly spaced BGR frames"""
+    images = []
+    for path in paths:
+        if not path.lower().endswith(VIDEO_EXTENSIONS):
+            images.append(path)
+            continue
+        capture = cv2.VideoCapture(path)
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        for index in range(frames_per_video):
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int((index + 0.5) * total / frames_per_video))
+            ok, frame = capture.read()
+            if ok:
+                images.append(frame)
+        capture.release()
+    return images
+
+def describe_all(analyzer, images, profile):
+    """Captions for all images in max_batch_size batches, and the seconds it took"""
+    analyzer._describe(images[:1], profile)  # warm-up
+    started = time.perf_counter()
+    descriptions = []
+    for offset in range(0, len(images), analyzer.max_batch_size):
+        descriptions += analyzer._describe(images[offset:offset + analyzer.max_batch_size], profile)
+    return descriptions, time.perf_counter() - started
+
+async def run(args):
+    if args.threads:
+        visual_analysis.TORCH_NUM_THREADS = args.threads
+    analyzer = VisualAnalyzer(max_batch_size=args.batch_size, decode_profile=REFERENCE_PROFILE, quantization=None)
+    await analyzer.initialize()
+
+    prepared = [analyzer._prepare_image(image) for image in load_frames(args.inputs, args.frames)]
+    if not prepared:
+        raise SystemExit("No frames to analyze")
+    rgb_images = [rgb for rgb, _ in prepared]
+    objects = []
+    for offset in range(0, len(prepared), analyzer.max_batch_size):
+        objects += analyzer._detect([source for _, source in prepared[offset:offset + analyzer.max_batch_size]])
+
+    def labels(descriptions):
+        return [(analyzer._categorize_scene(description, objs), analyzer._detect_action(description, objs))
+                for description, objs in zip(descriptions, objects)]
+
+    reference_descriptions, _ = describe_all(analyzer, rgb_images, REFERENCE_PROFILE)
+    reference = labels(reference_descriptions)
+    print(f"{len(rgb_images)} frames, batch size {analyzer.max_batch_size}, "
+          f"{args.threads or os.cpu_count()} threads, device {analyzer.device}\n")
+    print(f"{'profile':<16}{'weights':<9}{'ms/frame':>10}{'speedup':>9}{'category':>10}{'action':>8}{'both':>7}")
+
+    variants = [(None, analyzer)]
+    if not args.no_int8:
+        quantized = VisualAnalyzer(max_batch_size=args.batch_size, decode_profile=REFERENCE_PROFILE,
+                                   quantization="int8")
+        await quantized.ensure_model("blip")
+        variants.append(("int8", quantized))
+
+    baseline = None
+    for quantization, variant in variants:
+        for profile in args.profiles:
+            descriptions, seconds = describe_all(variant, rgb_images, profile)
+            result = labels(descriptions)
+            per_frame = seconds / len(rgb_images) * 1000
+            baseline = baseline or per_frame
+            same_category = sum(a[0] == b[0] for a, b in zip(result, reference)) / len(reference)
+            same_action = sum(a[1] == b[1] for a, b in zip(result, reference)) / len(reference)
+            same_both = sum(a == b for a, b in zip(result, reference)) / len(reference)
+            print(f"{profile:<16}{quantization or 'fp32':<9}{per_frame:>10.0f}{baseline / per_frame:>8.1f}x"
+                  f"{same_category:>10.0%}{same_action:>8.0%}{same_both:>7.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BLIP decode profiles against the beam5 reference")
+    parser.add_argument("inputs", nargs="+", help="Image files and/or videos")
+    parser.add_argument("--frames", type=int, default=32, help="Frames sampled per video")
+    parser.add_argument("--profiles", nargs="+", default=list(BLIP_DECODE_PROFILES),
+                        choices=list(BLIP_DECODE_PROFILES))
+    parser.add_argument("--batch-size", type=int, default=visual_analysis.ANALYSIS_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0 = torch default)")
+    parser.add_argument("--no-int8", action="store_true", help="Skip the int8 quantized model")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,26 @@ import os
 UPLOAD_DIR = "/app/videos/uploads"
 OUTPUT_DIR = "/app/videos/cutdowns"
 SEPARATED_DIR = "/app/videos/separated"
+ANALYSIS_CACHE_DIR = os.environ.get('ANALYSIS_CACHE_DIR', "/app/videos/cache/analysis")
 
 # Ensure directories exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(SEPARATED_DIR, exist_ok=True)
+os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
 
 # Application configuration
 DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
 
-# Model configuration
-MODELS_LOADED = False
+# Model configuration: models are loaded on first use; the ones listed here
+# (comma-separated, e.g. "blip,yolo") are warmed up in the background after startup
+PRELOAD_MODELS = [name.strip() for name in os.environ.get('PRELOAD_MODELS', '').split(',') if name.strip()]
+
+# Cutdown rendering: "single" renders all scenes in one FFmpeg pass,
+# "concat" cuts each scene to a temp file and concatenates them
+CUTDOWN_RENDER_MODE = os.environ.get('CUTDOWN_RENDER_MODE', 'single').lower()
+
+# Analysis result cache (shared volume, evicted least-recently-used first)
+ANALYSIS_CACHE_ENABLED = os.environ.get('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+ANALYSIS_CACHE_MAX_MB = int(os.environ.get('ANALYSIS_CACHE_MAX_MB', '512'))
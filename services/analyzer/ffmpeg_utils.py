@@ -1,37 +1,376 @@
+import asyncio
 import ffmpeg
+import json
 import os
+import shutil
 import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-def cut_clip(input_path, output_path, start_time, end_time):
+# Default cut engine: "auto" picks copy/smart/reencode per cut, "copy"/"reencode" force a mode.
+# Callers that join clips with -c copy always request "reencode" (see cut_clip).
+CUT_MODE = os.environ.get("CUT_MODE", "auto").lower()
+# How close (in seconds) a cut point has to be to a keyframe to count as "on" it
+KEYFRAME_TOLERANCE = float(os.environ.get("CUT_KEYFRAME_TOLERANCE", "0.04"))
+# Maximum difference between the expected and the probed duration of a smart cut
+CUT_DURATION_TOLERANCE = 0.5
+# Number of probe results kept in memory (least recently used are dropped)
+PROBE_CACHE_SIZE = int(os.environ.get("PROBE_CACHE_SIZE", "512"))
+
+def _to_seconds(value):
+    """Accept seconds (int/float/str) or HH:MM:SS(.ms) time strings"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        seconds = 0.0
+        for part in str(value).split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+
+_EMPTY_PROBE = {
+    "duration": None, "video_codec": None, "audio_codec": None, "format_name": None,
+    "video_profile": None, "video_level": None, "pix_fmt": None, "width": None, "height": None,
+    "audio_sample_rate": None, "audio_channels": None
+}
+
+def _parse_probe_output(stdout):
+    info = dict(_EMPTY_PROBE)
+    try:
+        data = json.loads(stdout or "{}")
+        info["format_name"] = data.get("format", {}).get("format_name")
+        duration = data.get("format", {}).get("duration")
+        info["duration"] = float(duration) if duration is not None else None
+        for stream in data.get("streams", []):
+            codec_type = stream.get("codec_type")
+            key = f"{codec_type}_codec"
+            if key not in info or info[key] is not None:
+                continue
+            info[key] = stream.get("codec_name")
+            if codec_type == "video":
+                info["video_profile"] = stream.get("profile")
+                info["video_level"] = stream.get("level")
+                info["pix_fmt"] = stream.get("pix_fmt")
+                info["width"] = stream.get("width")
+                info["height"] = stream.get("height")
+            else:
+                info["audio_sample_rate"] = stream.get("sample_rate")
+                info["audio_channels"] = stream.get("channels")
+    except (ValueError, TypeError):
+        pass
+    return info
+
+_PROBE_CMD = [
+    "ffprobe",
+    "-v", "quiet",
+    "-show_entries",
+    "format=duration,format_name:stream=codec_type,codec_name,profile,level,pix_fmt,width,height,sample_rate,channels",
+    "-of", "json"
+]
+
+# Probe results by (path, size, mtime); files are never modified in place, so
+# upload ingestion can hand over what it sniffed and later probes are free
+_probe_cache = OrderedDict()
+_probe_cache_lock = threading.Lock()
+
+def _file_identity(input_path):
+    try:
+        stat = os.stat(input_path)
+    except OSError:
+        return None
+    return (os.path.abspath(input_path), stat.st_size, stat.st_mtime_ns)
+
+def _cache_probe(identity, info):
+    with _probe_cache_lock:
+        _probe_cache[identity] = dict(info)
+        _probe_cache.move_to_end(identity)
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+
+def remember_media_info(input_path, info):
+    identity = _file_identity(input_path)
+    if identity is not None:
+        _cache_probe(identity, info)
+
+def probe_media(input_path):
+    """Return duration, codec names and encoding parameters of the first video/audio stream (None if unknown)"""
+    identity = _file_identity(input_path)
+    with _probe_cache_lock:
+        if identity in _probe_cache:
+            _probe_cache.move_to_end(identity)
+            return dict(_probe_cache[identity])
+    result = subprocess.run(_PROBE_CMD + [input_path], capture_output=True, text=True)
+    if result.returncode != 0:
+        return dict(_EMPTY_PROBE)
+    info = _parse_probe_output(result.stdout)
+    if identity is not None:
+        _cache_probe(identity, info)
+    return info
+
+def probe_media_header(header):
+    """Probe the leading bytes of a media file (e.g. while it is still being uploaded).
+
+    Only containers that store the duration in their header (MP4/MOV with the moov
+    atom up front, Matroska/WebM) are accepted; otherwise None is returned and
+    callers probe the complete file.
+    """
+    try:
+        result = subprocess.run(_PROBE_CMD + ["-i", "pipe:0"], input=header, capture_output=True, timeout=30)
+    except subprocess.TimeoutExpired:
+        return None
+    if result.returncode != 0:
+        return None
+    info = _parse_probe_output(result.stdout.decode(errors="replace"))
+    if not (info["format_name"] or "").startswith(("mov", "matroska")) or info["duration"] is None:
+        return None
+    return info
+
+def probe_keyframes(input_path, start_time, end_time):
+    """List video keyframe timestamps between start_time and end_time.
+
+    Only packet headers inside the interval are read (no decoding), so this is
+    cheap even near the end of a long master.
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "quiet",
+        "-select_streams", "v:0",
+        "-read_intervals", f"{max(0.0, start_time - 1)}%{end_time + 1}",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        input_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return []
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 2 or "K" not in parts[1]:
+            continue
+        try:
+            keyframes.append(float(parts[0]))
+        except ValueError:
+            continue
+    return sorted(keyframes)
+
+def plan_cut(keyframes, start_time, end_time, video_codec=None, audio_codec=None, mode=None):
+    """Pick the cheapest cut mode for a range.
+
+    Returns (mode, split_point):
+    - ("copy", k): start is within KEYFRAME_TOLERANCE of keyframe k, [k, end) is stream-copied
+      (k is None if copy was forced)
+    - ("smart", k): only [start, k) is re-encoded, [k, end) is stream-copied
+    - ("reencode", None): no usable keyframe inside the range (or codec unsupported)
+    """
+    mode = mode or CUT_MODE
+    if mode in ("copy", "reencode"):
+        return mode, None
+    matching = [k for k in keyframes if abs(k - start_time) <= KEYFRAME_TOLERANCE]
+    if matching:
+        # Seek to the keyframe itself: seeking to a start just before it would make
+        # the copy snap back to the previous keyframe
+        return "copy", min(matching, key=lambda k: abs(k - start_time))
+    # Smart cutting re-encodes the head with libx264/aac, so the copied part must match
+    if video_codec != "h264" or audio_codec not in (None, "aac"):
+        return "reencode", None
+    following = [k for k in keyframes if start_time < k < end_time - KEYFRAME_TOLERANCE]
+    if not following:
+        return "reencode", None
+    return "smart", following[0]
+
+def _run_ffmpeg(cmd, progress=None, duration=None):
+    """Run an FFmpeg command and return True on success.
+
+    If a progress callback and the expected output duration are given, FFmpeg's
+    -progress output is parsed and progress(fraction) is called as encoding advances.
+    """
+    if progress is None or not duration:
+        print(f"Running FFmpeg command: {' '.join(cmd)}")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"FFmpeg stderr: {result.stderr}")
+        return result.returncode == 0
+
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    print(f"Running FFmpeg command: {' '.join(cmd)}")
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            # out_time_us is the current output position (out_time_ms is also in microseconds)
+            if key in ("out_time_us", "out_time_ms") and value.isdigit():
+                progress(min(1.0, int(value) / 1_000_000 / duration))
+        returncode = process.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            print(f"FFmpeg stderr: {stderr.read()}")
+    return returncode == 0
+
+# ffprobe prints pts_time rounded to microseconds; seeking slightly past a keyframe
+# keeps the demuxer from snapping back to the keyframe before it
+_KEYFRAME_SEEK_OFFSET = 0.0005
+
+def _copy_cmd(input_path, output_path, start_time, duration, keyframe=False):
+    return [
+        "ffmpeg",
+        "-ss", str(start_time + _KEYFRAME_SEEK_OFFSET if keyframe else start_time),
+        "-i", input_path,
+        "-t", str(duration),
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-c", "copy",
+        "-avoid_negative_ts", "make_zero",
+        "-y",
+        output_path
+    ]
+
+def _reencode_cmd(input_path, output_path, start_time, duration, crf="23"):
+    return [
+        "ffmpeg",
+        "-ss", str(start_time),
+        "-i", input_path,
+        "-t", str(duration),
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-c:v", "libx264",
+        "-c:a", "aac",
+        "-preset", "ultrafast",
+        "-crf", crf,
+        "-threads", str(CUT_THREADS),
+        "-y",
+        output_path
+    ]
+
+# ffprobe H.264 profile names -> libx264 -profile:v
+_X264_PROFILES = {
+    "constrained baseline": "baseline",
+    "baseline": "baseline",
+    "main": "main",
+    "high": "high",
+    "high 10": "high10",
+    "high 4:2:2": "high422",
+    "high 4:4:4 predictive": "high444",
+}
+
+def _matching_encoder_args(media):
+    """libx264/aac arguments that reproduce the source's profile, level, pixel format and audio layout"""
+    args = []
+    profile = _X264_PROFILES.get((media.get("video_profile") or "").lower())
+    if profile:
+        args += ["-profile:v", profile]
+    level = media.get("video_level")
+    if isinstance(level, int) and level > 0:
+        # ffprobe reports level_idc, e.g. 41 for level 4.1
+        args += ["-level:v", f"{level // 10}.{level % 10}"]
+    if media.get("pix_fmt"):
+        args += ["-pix_fmt", media["pix_fmt"]]
+    if media.get("audio_sample_rate"):
+        args += ["-ar", str(media["audio_sample_rate"])]
+    if media.get("audio_channels"):
+        args += ["-ac", str(media["audio_channels"])]
+    return args
+
+# Parameters the re-encoded head must share with the stream-copied tail
+_SPLICE_PARAMS = ("video_codec", "video_profile", "video_level", "pix_fmt", "width", "height")
+
+def _verify_cut(output_path, expected_duration, media, parts=None):
+    """Check with ffprobe that a cut is readable, keeps the source streams and has the expected length.
+
+    parts=(head, tail) additionally checks that both spliced parts share codec,
+    profile, level, pixel format and resolution, since a mismatch there plays
+    back broken even though the container probes fine.
+    """
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return False
+    if parts is not None:
+        head, tail = (probe_media(part) for part in parts)
+        mismatched = [key for key in _SPLICE_PARAMS if head[key] != tail[key]]
+        if mismatched:
+            print(f"  Smart cut verification failed: head/tail differ in {', '.join(mismatched)} "
+                  f"({[head[key] for key in mismatched]} vs {[tail[key] for key in mismatched]})")
+            return False
+    result = probe_media(output_path)
+    if result["video_codec"] != media["video_codec"] or result["audio_codec"] != media["audio_codec"]:
+        print(f"  Smart cut verification failed: streams {result['video_codec']}/{result['audio_codec']}")
+        return False
+    if result["duration"] is None or abs(result["duration"] - expected_duration) > CUT_DURATION_TOLERANCE:
+        print(f"  Smart cut verification failed: duration {result['duration']}s, expected {expected_duration}s")
+        return False
+    return True
+
+def _smart_cut(input_path, output_path, start_time, end_time, split_point, media):
+    """Re-encode the GOP fragment before split_point and stream-copy the rest.
+
+    The head is encoded with the source's profile, level and pixel format so both
+    parts share decoder parameters. Both parts go through MPEG-TS (SPS/PPS in-band)
+    and are joined with the concat demuxer, which continues the tail's timestamps
+    after the head; the result is checked with ffprobe. Returns False if any step
+    fails, so the caller can fall back to a full re-encode.
+    """
+    work_dir = tempfile.mkdtemp(prefix="smartcut_", dir=os.path.dirname(os.path.abspath(output_path)))
+    head = os.path.join(work_dir, "head.ts")
+    tail = os.path.join(work_dir, "tail.ts")
+    list_file = os.path.join(work_dir, "parts.txt")
+    try:
+        head_cmd = _reencode_cmd(input_path, head, start_time, split_point - start_time, crf="18")
+        head_cmd[-2:-2] = _matching_encoder_args(media)
+        if not _run_ffmpeg(head_cmd):
+            return False
+        if not _run_ffmpeg(_copy_cmd(input_path, tail, split_point, end_time - split_point, keyframe=True)):
+            return False
+        with open(list_file, "w") as f:
+            f.write(f"file '{head}'\nfile '{tail}'\n")
+        if not _run_ffmpeg([
+            "ffmpeg",
+            "-f", "concat", "-safe", "0",
+            "-i", list_file,
+            "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            "-y",
+            output_path
+        ]):
+            return False
+        return _verify_cut(output_path, end_time - start_time, media, parts=(head, tail))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def cut_clip_smart(input_path, output_path, start_time, end_time, mode=None):
+    """Cut [start_time, end_time) and return the mode used ("copy", "smart", "reencode"), or None on failure.
+
+    Seeking always happens on the input side. If the start lands on a keyframe the
+    range is stream-copied; otherwise only the partial GOP at the start is re-encoded.
+    Ending mid-GOP needs no re-encode because every frame before the end point is
+    decodable from its own keyframe. mode overrides CUT_MODE ("auto", "copy", "reencode").
+
+    Copy and smart cuts keep the source's codec parameters, so only hand them to
+    callers that use the clip on its own; clips joined with -c copy must all be
+    cut with mode="reencode".
+    """
+    mode = mode or CUT_MODE
     try:
-        # Calculate duration
+        start_time = _to_seconds(start_time)
+        end_time = _to_seconds(end_time)
         duration = end_time - start_time
-        
+
         print(f"Cutting video: {input_path}")
         print(f"  Start time: {start_time}s")
         print(f"  End time: {end_time}s")
         print(f"  Duration: {duration}s")
         print(f"  Output: {output_path}")
-        
-        # Get video duration using ffprobe
-        probe_cmd = [
-            "ffprobe", 
-            "-v", "quiet", 
-            "-show_entries", "format=duration", 
-            "-of", "csv=p=0", 
-            input_path
-        ]
-        
-        probe_result = subprocess.run(probe_cmd, capture_output=True, text=True)
-        if probe_result.returncode == 0:
-            video_duration = float(probe_result.stdout.strip())
+
+        media = probe_media(input_path)
+        video_duration = media["duration"]
+        if video_duration is not None:
             print(f"  Video duration: {video_duration}s")
-            
+
             # Validate time ranges
             if start_time >= video_duration:
                 print(f"  ERROR: Start time {start_time}s is beyond video duration {video_duration}s")
-                return False
-            
+                return None
+
             if end_time > video_duration:
                 print(f"  WARNING: End time {end_time}s is beyond video duration {video_duration}s, adjusting to {video_duration}s")
                 end_time = video_duration
@@ -39,42 +378,138 @@ def cut_clip(input_path, output_path, start_time, end_time):
                 print(f"  Adjusted duration: {duration}s")
         else:
             print(f"  WARNING: Could not determine video duration")
-        
-        # Use correct FFmpeg syntax for cutting video
-        # The issue is that we need to use -ss for seeking and -t for duration correctly
-        # We'll use subprocess directly for more control
-        cmd = [
-            "ffmpeg",
-            "-i", input_path,
-            "-ss", str(start_time),
-            "-t", str(duration),
+
+        keyframes = [] if mode == "reencode" else probe_keyframes(input_path, start_time, end_time)
+        mode, split_point = plan_cut(keyframes, start_time, end_time,
+                                     media["video_codec"], media["audio_codec"], mode=mode)
+        print(f"  Cut mode: {mode}" + (f" (split at {split_point}s)" if split_point is not None else ""))
+
+        if mode == "copy" and split_point is not None:
+            ok = _run_ffmpeg(_copy_cmd(input_path, output_path, split_point, end_time - split_point, keyframe=True))
+        elif mode == "copy":
+            ok = _run_ffmpeg(_copy_cmd(input_path, output_path, start_time, duration))
+        elif mode == "smart":
+            ok = _smart_cut(input_path, output_path, start_time, end_time, split_point, media)
+        else:
+            ok = _run_ffmpeg(_reencode_cmd(input_path, output_path, start_time, duration))
+
+        if not ok and mode != "reencode":
+            print(f"  WARNING: {mode} cut failed, falling back to re-encode")
+            mode = "reencode"
+            ok = _run_ffmpeg(_reencode_cmd(input_path, output_path, start_time, duration))
+
+        # Check if output file exists and has content
+        if ok and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            file_size = os.path.getsize(output_path)
+            print(f"  Success: Output file created with size {file_size} bytes ({mode})")
+            return mode
+        print(f"  Error: Output file not created")
+        return None
+
+    except Exception as e:
+        print(f"FFmpeg error in cut_clip: {e}")
+        return None
+
+def cut_clip(input_path, output_path, start_time, end_time, mode=None):
+    """Cut a clip and return True on success (see cut_clip_smart for the mode used)"""
+    return cut_clip_smart(input_path, output_path, start_time, end_time, mode=mode) is not None
+
+def _default_cut_workers():
+    """Size the cut pool by CPU count and by how many FFmpeg encoders fit in memory"""
+    cpu_workers = os.cpu_count() or 1
+    per_worker = int(os.environ.get("CUT_WORKER_MEMORY_MB", "512")) * 1024 * 1024
+    try:
+        total_memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        memory_workers = max(1, total_memory // per_worker)
+    except (ValueError, OSError, AttributeError):
+        memory_workers = cpu_workers
+    return max(1, min(cpu_workers, memory_workers))
+
+# Each worker thread only waits on its own FFmpeg child process, so the pool size
+# is the number of concurrent FFmpeg cuts.
+CUT_WORKERS = int(os.environ.get("CUT_WORKERS", "0")) or _default_cut_workers()
+# x264 threads per cut, so that CUT_WORKERS parallel encodes together use about one thread per core
+CUT_THREADS = int(os.environ.get("CUT_THREADS", "0")) or max(1, (os.cpu_count() or 1) // CUT_WORKERS)
+_cut_executor = ThreadPoolExecutor(max_workers=CUT_WORKERS, thread_name_prefix="cut")
+
+async def cut_clip_smart_async(input_path, output_path, start_time, end_time, mode=None):
+    """cut_clip_smart on the cut pool, without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _cut_executor, partial(cut_clip_smart, input_path, output_path, start_time, end_time, mode=mode)
+    )
+
+async def cut_clips_async(jobs, progress=None, mode=None):
+    """Run cut_clip for (input_path, output_path, start_time, end_time) jobs on the cut pool.
+
+    Returns one bool per job, in the order the jobs were given, without blocking
+    the event loop. progress(fraction) is called as cuts complete. Pass
+    mode="reencode" when the clips are joined afterwards with -c copy.
+    """
+    loop = asyncio.get_running_loop()
+    futures = [loop.run_in_executor(_cut_executor, partial(cut_clip, *job, mode=mode)) for job in jobs]
+    if progress is not None:
+        done = 0
+        def _on_done(_):
+            nonlocal done
+            done += 1
+            progress(done / len(futures))
+        for future in futures:
+            future.add_done_callback(_on_done)
+    return await asyncio.gather(*futures)
+
+def render_cutdown(input_path, segments, output_path, audio_path=None, progress=None):
+    """Render a list of (start, end) segments of one video in a single FFmpeg pass.
+
+    Each segment is opened as its own input with input-side -ss/-t (the trim happens
+    at demux level, no decoding from time zero) and the segments are joined with the
+    concat filter. If audio_path (file or URL) is given it replaces the original audio
+    in the same invocation, so no intermediate files are written. progress(fraction)
+    is called while FFmpeg encodes.
+    """
+    try:
+        segments = [(_to_seconds(start), _to_seconds(end)) for start, end in segments]
+        segments = [(start, end) for start, end in segments if end > start]
+        if not segments:
+            print("render_cutdown: no valid segments")
+            return False
+
+        has_source_audio = probe_media(input_path)["audio_codec"] is not None
+        use_source_audio = has_source_audio and not audio_path
+
+        cmd = ["ffmpeg"]
+        for start, end in segments:
+            cmd += ["-ss", str(start), "-t", str(end - start), "-i", input_path]
+        if audio_path:
+            cmd += ["-i", audio_path]
+
+        labels = ""
+        for i in range(len(segments)):
+            labels += f"[{i}:v:0]" + (f"[{i}:a:0]" if use_source_audio else "")
+        filter_graph = f"{labels}concat=n={len(segments)}:v=1:a={1 if use_source_audio else 0}[v]"
+        if use_source_audio:
+            filter_graph += "[a]"
+
+        cmd += ["-filter_complex", filter_graph, "-map", "[v]"]
+        if use_source_audio:
+            cmd += ["-map", "[a]"]
+        elif audio_path:
+            cmd += ["-map", f"{len(segments)}:a:0", "-shortest"]
+        cmd += [
             "-c:v", "libx264",
-            "-c:a", "aac",
             "-preset", "ultrafast",
             "-crf", "23",
-            "-y",  # Overwrite output
+            "-c:a", "aac",
+            "-y",
             output_path
         ]
-        
-        print(f"Running FFmpeg command: {' '.join(cmd)}")
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        print(f"FFmpeg stdout: {result.stdout}")
-        print(f"FFmpeg stderr: {result.stderr}")
-        print(f"FFmpeg return code: {result.returncode}")
-        
-        # Check if output file exists and has content
-        if os.path.exists(output_path):
-            file_size = os.path.getsize(output_path)
-            print(f"  Success: Output file created with size {file_size} bytes")
-            return True
-        else:
-            print(f"  Error: Output file not created")
+
+        total_duration = sum(end - start for start, end in segments)
+        if not _run_ffmpeg(cmd, progress=progress, duration=total_duration):
             return False
-            
+        return os.path.exists(output_path) and os.path.getsize(output_path) > 0
     except Exception as e:
-        print(f"FFmpeg error in cut_clip: {e}")
+        print(f"FFmpeg error in render_cutdown: {e}")
         return False
 
 def extract_audio(video_path, output_dir):
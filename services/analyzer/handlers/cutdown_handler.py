@@ -1,14 +1,16 @@
 # handlers/cutdown_handler.py
 import os
 import uuid
+import asyncio
 import subprocess
-import requests
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from utils.error_handler import VideoProcessingError, FileNotFoundError
-from config import OUTPUT_DIR, SEPARATED_DIR
-from ffmpeg_utils import cut_clip, separate_video_audio
+from config import OUTPUT_DIR, SEPARATED_DIR, CUTDOWN_RENDER_MODE
+from ffmpeg_utils import cut_clips_async, render_cutdown, separate_video_audio
 from models.requests import SelectedScene
+from utils.job_manager import ProgressCallback, scaled_progress
+from utils.http_clients import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +35,8 @@ def normalize_video_path(input_path: str) -> str:
         return input_path.replace('/videos/', '/app/videos/')
     return input_path
 
-async def generate_cutdown_v2(request_data: Dict[str, Any]) -> Dict[str, str]:
+async def generate_cutdown_v2(request_data: Dict[str, Any],
+                              progress: Optional[ProgressCallback] = None) -> Dict[str, str]:
     """Generate cutdown from selected scenes"""
     try:
         selected_scenes = request_data.get('selected_scenes', [])
@@ -55,87 +58,129 @@ async def generate_cutdown_v2(request_data: Dict[str, Any]) -> Dict[str, str]:
         if not base_video or not os.path.exists(base_video):
             raise FileNotFoundError(base_video or "base video")
         
-        # Use existing cut scene files instead of cutting new ones
-        scene_files = []
-        for i, scene in enumerate(selected_scenes):
-            scene_number = scene.get('scene_number', i)
-            
-            # Look for existing cut scene file
-            base_filename = os.path.splitext(os.path.basename(base_video))[0]
-            cut_scene_filename = f"{base_filename}_cut_scene_{scene_number}.mp4"
-            cut_scene_path = os.path.join(OUTPUT_DIR, cut_scene_filename)
-            
-            if os.path.exists(cut_scene_path) and os.path.getsize(cut_scene_path) > 0:
-                scene_files.append(cut_scene_path)
-                logger.info(f"Using existing cut scene: {cut_scene_filename}")
-            else:
-                # Fallback: cut from original video if cut scene doesn't exist
-                start_time = time_string_to_seconds(scene['start_time'])
-                end_time = time_string_to_seconds(scene['end_time'])
-                duration = end_time - start_time
-                
-                scene_filename = f"scene_{i:03d}_{uuid.uuid4().hex[:8]}.mp4"
-                scene_path = os.path.join(OUTPUT_DIR, scene_filename)
-                
-                cut_clip(base_video, scene_path, start_time, duration)
-                scene_files.append(scene_path)
-                logger.warning(f"Cut scene not found, created new: {scene_filename}")
-        
-        # Concatenate scenes
         final_filename = f"cutdown_{uuid.uuid4().hex[:8]}.mp4"
         final_path = os.path.join(OUTPUT_DIR, final_filename)
         
-        # Create concat file
-        concat_file = os.path.join(OUTPUT_DIR, f"concat_{uuid.uuid4().hex[:8]}.txt")
-        with open(concat_file, 'w') as f:
-            for scene_file in scene_files:
-                f.write(f"file '{scene_file}'\n")
-        
-        # Concatenate using ffmpeg
-        cmd = [
-            "ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_file,
-            "-c", "copy", "-y", final_path
-        ]
+        if CUTDOWN_RENDER_MODE == 'single':
+            # One FFmpeg pass: scenes and audio go straight into the final file.
+            # FFmpeg reads HTTP audio URLs itself, so nothing is downloaded first.
+            audio_source = None
+            if audio_file:
+                audio_source = audio_file if audio_file.startswith('http') else normalize_video_path(audio_file)
+            segments = [
+                (time_string_to_seconds(scene['start_time']), time_string_to_seconds(scene['end_time']))
+                for scene in selected_scenes
+            ]
+            if await asyncio.to_thread(render_cutdown, base_video, segments, final_path, audio_source, progress):
+                return {"output_url": final_path.replace('/app/videos/', '/videos/')}
+            logger.warning("Single-pass render failed, falling back to per-scene concat")
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise VideoProcessingError(f"FFmpeg concatenation failed: {result.stderr}")
+        final_path = await _render_by_concat(base_video, selected_scenes, audio_file, final_path, progress)
+        return {"output_url": final_path.replace('/app/videos/', '/videos/')}
         
-        # Add audio if provided
-        if audio_file:
-            audio_path = os.path.join(OUTPUT_DIR, f"audio_{uuid.uuid4().hex[:8]}.mp3")
-            
-            # Download audio file
-            if audio_file.startswith('http'):
-                response = requests.get(audio_file)
-                with open(audio_path, 'wb') as f:
-                    f.write(response.content)
-            else:
-                audio_path = normalize_video_path(audio_file)
+    except Exception as e:
+        raise VideoProcessingError(f"Failed to generate cutdown: {str(e)}")
+
+async def _render_by_concat(base_video: str, selected_scenes: List[Dict[str, Any]],
+                            audio_file: str, final_path: str,
+                            progress: Optional[ProgressCallback] = None) -> str:
+    """Cut each scene to a file, concatenate them and mux the audio (multi-pass)"""
+    # Use existing cut scene files instead of cutting new ones
+    scene_files = []
+    cut_jobs = []
+    for i, scene in enumerate(selected_scenes):
+        scene_number = scene.get('scene_number', i)
+        
+        # Look for existing cut scene file
+        base_filename = os.path.splitext(os.path.basename(base_video))[0]
+        cut_scene_filename = f"{base_filename}_cut_scene_{scene_number}.mp4"
+        cut_scene_path = os.path.join(OUTPUT_DIR, cut_scene_filename)
+        
+        if os.path.exists(cut_scene_path) and os.path.getsize(cut_scene_path) > 0:
+            scene_files.append(cut_scene_path)
+            logger.info(f"Using existing cut scene: {cut_scene_filename}")
+        else:
+            # Fallback: cut from original video if cut scene doesn't exist
+            start_time = time_string_to_seconds(scene['start_time'])
+            end_time = time_string_to_seconds(scene['end_time'])
             
-            # Merge video and audio
-            final_with_audio = os.path.join(OUTPUT_DIR, f"final_{uuid.uuid4().hex[:8]}.mp4")
-            cmd = [
-                "ffmpeg", "-i", final_path, "-i", audio_path,
-                "-c:v", "copy", "-c:a", "aac", "-shortest", "-y", final_with_audio
-            ]
+            scene_filename = f"scene_{i:03d}_{uuid.uuid4().hex[:8]}.mp4"
+            scene_path = os.path.join(OUTPUT_DIR, scene_filename)
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                final_path = final_with_audio
-        
-        # Clean up temporary files
-        os.remove(concat_file)
+            cut_jobs.append((base_video, scene_path, start_time, end_time))
+            scene_files.append(scene_path)
+            logger.warning(f"Cut scene not found, creating new: {scene_filename}")
+    
+    # Missing scenes are cut in parallel on the bounded cut pool
+    if cut_jobs:
+        results = await cut_clips_async(cut_jobs, progress=scaled_progress(progress, 0.0, 0.9), mode="reencode")
+        for (_, scene_path, _, _), success in zip(cut_jobs, results):
+            if not success:
+                raise VideoProcessingError(f"Failed to cut scene: {os.path.basename(scene_path)}")
+    
+    # Existing cut scenes may be stream copies with the source's codec parameters,
+    # which cannot be joined with -c copy next to our re-encoded clips
+    reencode = len(cut_jobs) < len(scene_files)
+    return await asyncio.to_thread(_concat_and_mux, scene_files, audio_file, final_path, reencode)
+
+def _concat_and_mux(scene_files: List[str], audio_file: str, final_path: str, reencode: bool = False) -> str:
+    """Concatenate scene files and mux the audio track (blocking, run off the event loop).
+
+    Clips are joined with -c copy unless reencode is set (clips with differing codec parameters).
+    """
+    # Create concat file
+    concat_file = os.path.join(OUTPUT_DIR, f"concat_{uuid.uuid4().hex[:8]}.txt")
+    with open(concat_file, 'w') as f:
         for scene_file in scene_files:
-            if os.path.exists(scene_file):
-                os.remove(scene_file)
+            f.write(f"file '{scene_file}'\n")
+    
+    # Concatenate using ffmpeg
+    cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_file]
+    if reencode:
+        cmd += ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-c:a", "aac"]
+    else:
+        cmd += ["-c", "copy"]
+    cmd += ["-y", final_path]
+    
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise VideoProcessingError(f"FFmpeg concatenation failed: {result.stderr}")
+    
+    # Add audio if provided
+    if audio_file:
+        audio_path = os.path.join(OUTPUT_DIR, f"audio_{uuid.uuid4().hex[:8]}.mp3")
+        
+        # Download audio file
+        if audio_file.startswith('http'):
+            with get_client('frontend').get(audio_file, stream=True) as response:
+                response.raise_for_status()
+                with open(audio_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+        else:
+            audio_path = normalize_video_path(audio_file)
         
-        return {"output_url": final_path.replace('/app/videos/', '/videos/')}
+        # Merge video and audio
+        final_with_audio = os.path.join(OUTPUT_DIR, f"final_{uuid.uuid4().hex[:8]}.mp4")
+        cmd = [
+            "ffmpeg", "-i", final_path, "-i", audio_path,
+            "-c:v", "copy", "-c:a", "aac", "-shortest", "-y", final_with_audio
+        ]
         
-    except Exception as e:
-        raise VideoProcessingError(f"Failed to generate cutdown: {str(e)}")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode == 0:
+            final_path = final_with_audio
+    
+    # Clean up temporary files
+    os.remove(concat_file)
+    for scene_file in scene_files:
+        if os.path.exists(scene_file):
+            os.remove(scene_file)
+    
+    return final_path
 
-async def separate_video_audio_handler(file_path: str) -> Dict[str, str]:
+async def separate_video_audio_handler(file_path: str,
+                                       progress: Optional[ProgressCallback] = None) -> Dict[str, str]:
     """Separate video and audio from file"""
     try:
         normalized_path = normalize_video_path(file_path)
@@ -146,7 +191,9 @@ async def separate_video_audio_handler(file_path: str) -> Dict[str, str]:
         video_output = os.path.join(SEPARATED_DIR, f"{filename}_video.mp4")
         audio_output = os.path.join(SEPARATED_DIR, f"{filename}_audio.mp3")
         
-        result = separate_video_audio(normalized_path, SEPARATED_DIR)
+        result = await asyncio.to_thread(separate_video_audio, normalized_path, SEPARATED_DIR)
+        if progress is not None:
+            progress(1.0)
         
         if not result or "audio_path" not in result:
             raise VideoProcessingError("Audio extraction failed - no audio stream found or file corrupted")
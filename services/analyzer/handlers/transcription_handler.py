@@ -0,0 +1,103 @@
+# handlers/transcription_handler.py
+import os
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+from utils.error_handler import FileNotFoundError, TranscriptionError
+from utils.http_clients import get_async_client
+from ffmpeg_utils import probe_media
+
+logger = logging.getLogger(__name__)
+
+WHISPER_URL = os.environ.get('WHISPER_URL', 'http://whisper:9000')
+# Let whisper read the file from the shared volume instead of uploading it
+WHISPER_SHARED_PATHS = os.environ.get('WHISPER_SHARED_PATHS', 'true').lower() == 'true'
+# Upper bound for transcription time per second of audio; long files get a read
+# timeout above the whisper default (HTTP_WHISPER_TIMEOUT) in proportion to their length
+WHISPER_SECONDS_PER_AUDIO_SECOND = float(os.environ.get('WHISPER_SECONDS_PER_AUDIO_SECOND', '1.5'))
+
+# Cleared once whisper answers that it has no /asr-path route (whisper image older
+# than the analyzer), so later calls upload right away instead of failing over each time
+_asr_path_available = True
+
+def _route_missing(response) -> bool:
+    """True for FastAPI's own 404/405 (unknown route), not /asr-path's file-not-found 404"""
+    if response.status_code == 405:
+        return True
+    try:
+        return response.json() == {"detail": "Not Found"}
+    except ValueError:
+        return False
+
+def normalize_media_path(file_path: str) -> str:
+    """Convert /videos/ URLs to /app/videos/ paths on the shared volume"""
+    if file_path.startswith('/videos/'):
+        return '/app' + file_path
+    return file_path
+
+async def transcribe_file(file_path: str, language: Optional[str] = None) -> Dict[str, Any]:
+    """Transcribe an audio/video file with the whisper service.
+
+    Whisper reads the file by path from the shared volume when possible; otherwise
+    (older whisper image, file not mounted there) the file is streamed from disk
+    as the request body. The event loop is never blocked by the transfer or the
+    transcription itself.
+    """
+    file_path = normalize_media_path(file_path)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+
+    client = get_async_client('whisper')
+    media = await asyncio.to_thread(probe_media, file_path)
+    timeout = client.config.timeout_for(media["duration"], WHISPER_SECONDS_PER_AUDIO_SECOND)
+    global _asr_path_available
+    if WHISPER_SHARED_PATHS and _asr_path_available:
+        payload = {"path": file_path}
+        if language:
+            payload["language_code"] = language
+        response = await client.post(f"{WHISPER_URL}/asr-path", json=payload, timeout=timeout)
+        if response.status_code == 200:
+            return response.json()
+        # 404: endpoint or file not available in the whisper container
+        if response.status_code not in (404, 405):
+            raise TranscriptionError(f"Whisper transcription failed: {response.text}", response.status_code)
+        if _route_missing(response):
+            _asr_path_available = False
+            logger.warning("Whisper service has no /asr-path endpoint, uploading files from now on")
+        else:
+            logger.info(f"Whisper cannot read {file_path} by path, uploading it instead")
+
+    data = {'language_code': language} if language else {}
+    with open(file_path, 'rb') as audio_file:
+        # httpx streams the multipart body from the open file in small chunks
+        files = {'audio_file': (os.path.basename(file_path), audio_file, 'application/octet-stream')}
+        response = await client.post(f"{WHISPER_URL}/asr", files=files, data=data, timeout=timeout)
+    if response.status_code != 200:
+        raise TranscriptionError(f"Whisper transcription failed: {response.text}", response.status_code)
+    return response.json()
+
+async def detect_language(file_path: str) -> Dict[str, Any]:
+    """Detect the spoken language of a file with the whisper service.
+
+    Whisper decodes only the first seconds, read by path from the shared volume;
+    if it cannot see the file (or has no path route), the file is uploaded instead.
+    """
+    file_path = normalize_media_path(file_path)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+
+    client = get_async_client('whisper')
+    if WHISPER_SHARED_PATHS:
+        response = await client.post(f"{WHISPER_URL}/detect-language-path", json={"path": file_path})
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code not in (404, 405):
+            raise TranscriptionError(f"Whisper language detection failed: {response.text}", response.status_code)
+        logger.info(f"Whisper cannot read {file_path} by path, uploading it for language detection")
+
+    with open(file_path, 'rb') as audio_file:
+        files = {'audio_file': (os.path.basename(file_path), audio_file, 'application/octet-stream')}
+        response = await client.post(f"{WHISPER_URL}/detect-language", files=files)
+    if response.status_code != 200:
+        raise TranscriptionError(f"Whisper language detection failed: {response.text}", response.status_code)
+    return response.json()
@@ -2,12 +2,21 @@
 import os
 import uuid
 import asyncio
-from typing import Dict, Any
+from collections import deque
+from typing import Dict, Any, Optional
 from fastapi import UploadFile
-from utils.error_handler import VideoProcessingError, FileNotFoundError, handle_exception
+from utils.error_handler import (
+    VideoProcessingError, FileNotFoundError, ModelNotLoadedError, InferenceBusyError, handle_exception
+)
 from config import UPLOAD_DIR, OUTPUT_DIR
-from scene_utils import analyze_scenes
+from scene_utils import analyze_scenes, resolve_detector_params
 from visual_analysis import visual_analyzer
+from utils.analysis_cache import analysis_cache, fingerprint_file
+from utils.job_manager import ProgressCallback, scaled_progress
+from utils.upload_stream import stream_upload_to_file
+
+# Keyframe batches waiting for or running on the visual models per analysis
+MAX_FRAME_BATCHES_IN_FLIGHT = 2
 
 async def save_uploaded_file(file: UploadFile) -> str:
     """Save uploaded file and return the file path"""
@@ -17,23 +26,62 @@ async def save_uploaded_file(file: UploadFile) -> str:
         unique_filename = f"{uuid.uuid4()}_{file.filename}"
         file_path = os.path.join(UPLOAD_DIR, unique_filename)
         
-        # Save file
-        content = await file.read()
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
+        # Copy to disk in chunks; fingerprint and metadata are computed on the way
+        await stream_upload_to_file(file, file_path)
         
         return file_path
     except Exception as e:
         raise VideoProcessingError(f"Failed to save uploaded file: {str(e)}")
 
-async def analyze_video_file(file_path: str) -> Dict[str, Any]:
+def _screenshots_exist(scenes) -> bool:
+    """Cached results are only usable while the screenshots they link to still exist"""
+    return all(
+        os.path.exists(screenshot['path'])
+        for scene in scenes
+        for screenshot in scene.get('screenshots') or []
+    )
+
+def _analysis_cache_key(fingerprint: str, kind: str, **params) -> str:
+    threshold, min_scene_len = resolve_detector_params()
+    return analysis_cache.make_key(
+        fingerprint,
+        kind=kind,
+        threshold=threshold,
+        min_scene_len=min_scene_len,
+        **params
+    )
+
+def _screenshots_name(fingerprint: str) -> str:
+    """Screenshot directory for a video's content and detector settings.
+
+    Cached results link to these screenshots, so they must not live under the file
+    name, which another video with the same name would overwrite.
+    """
+    threshold, min_scene_len = resolve_detector_params()
+    return f"{fingerprint}_{threshold:g}_{min_scene_len}"
+
+def _get_cached_scenes(cache_key: str):
+    scenes = analysis_cache.get(cache_key)
+    if scenes is not None and _screenshots_exist(scenes):
+        return scenes
+    return None
+
+async def analyze_video_file(file_path: str, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
     """Analyze video file and return scene information"""
     try:
         if not os.path.exists(file_path):
             raise FileNotFoundError(file_path)
         
-        # Analyze scenes
-        scenes = analyze_scenes(file_path)
+        # Analyze scenes (or reuse a previous result for the same content and settings)
+        # Hashing reads the whole file (unless it was fingerprinted at upload)
+        fingerprint = await asyncio.to_thread(fingerprint_file, file_path)
+        cache_key = _analysis_cache_key(fingerprint, "scenes")
+        scenes = _get_cached_scenes(cache_key)
+        if scenes is None:
+            scenes = await asyncio.to_thread(
+                analyze_scenes, file_path, progress=progress, screenshots_name=_screenshots_name(fingerprint)
+            )
+            analysis_cache.put(cache_key, scenes)
         
         # Generate video ID and filename
         video_id = str(uuid.uuid4())
@@ -47,23 +95,44 @@ async def analyze_video_file(file_path: str) -> Dict[str, Any]:
     except Exception as e:
         raise VideoProcessingError(f"Failed to analyze video: {str(e)}")
 
-async def analyze_video_with_ai(file_path: str) -> Dict[str, Any]:
+async def analyze_video_with_ai(file_path: str, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
     """Analyze video with AI models"""
     try:
         if not os.path.exists(file_path):
             raise FileNotFoundError(file_path)
         
-        # Analyze scenes
-        scenes = analyze_scenes(file_path)
-        
-        # Analyze each scene with AI
-        for scene in scenes:
-            if scene.get('screenshots'):
-                for screenshot in scene['screenshots']:
-                    screenshot_path = screenshot['url'].replace('/videos/', '/app/videos/')
-                    if os.path.exists(screenshot_path):
-                        analysis = await visual_analyzer.analyze_image(screenshot_path)
-                        screenshot['ai_analysis'] = analysis
+        fingerprint = await asyncio.to_thread(fingerprint_file, file_path)
+        cache_key = _analysis_cache_key(fingerprint, "ai", models=visual_analyzer.model_version)
+        scenes = _get_cached_scenes(cache_key)
+        if scenes is None:
+            loop = asyncio.get_running_loop()
+            in_flight = deque()
+
+            async def analyze_batch(batch):
+                analyses = await visual_analyzer.analyze_images([frame for _, frame in batch])
+                for (screenshot, _), analysis in zip(batch, analyses):
+                    screenshot['ai_analysis'] = analysis
+
+            def on_frames(batch):
+                # Runs on the decoding thread: keyframes go to the models as scenes close
+                # (no screenshot re-reads from disk); with at most MAX_FRAME_BATCHES_IN_FLIGHT
+                # batches pending, decoding waits instead of piling up frames in memory
+                while len(in_flight) >= MAX_FRAME_BATCHES_IN_FLIGHT:
+                    in_flight.popleft().result()
+                in_flight.append(asyncio.run_coroutine_threadsafe(analyze_batch(batch), loop))
+
+            try:
+                scenes = await asyncio.to_thread(
+                    analyze_scenes, file_path, on_frames=on_frames, progress=scaled_progress(progress, 0.0, 0.95),
+                    screenshots_name=_screenshots_name(fingerprint)
+                )
+                while in_flight:
+                    await asyncio.wrap_future(in_flight.popleft())
+            finally:
+                for future in in_flight:
+                    future.cancel()
+            
+            analysis_cache.put(cache_key, scenes)
         
         # Generate video ID and filename
         video_id = str(uuid.uuid4())
@@ -74,5 +143,8 @@ async def analyze_video_with_ai(file_path: str) -> Dict[str, Any]:
             "filename": filename,
             "scenes": scenes
         }
+    except (ModelNotLoadedError, InferenceBusyError):
+        # Keep the 503, clients retry these
+        raise
     except Exception as e:
         raise VideoProcessingError(f"Failed to analyze video with AI: {str(e)}")
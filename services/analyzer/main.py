@@ -4,19 +4,22 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 import logging
 import asyncio
-from typing import List
+from typing import List, Optional
 
 # Import our modular components
-from config import UPLOAD_DIR, OUTPUT_DIR, SEPARATED_DIR, MODELS_LOADED
+from config import UPLOAD_DIR, OUTPUT_DIR, SEPARATED_DIR, PRELOAD_MODELS
 from models.requests import (
     VideoPathRequest, TranscribeRequest, CutdownRequest, 
     ScenesRequest, CompilationRequest, CutdownV2Request
 )
 from handlers.video_handler import analyze_video_file, analyze_video_with_ai, save_uploaded_file
 from handlers.cutdown_handler import generate_cutdown_v2, separate_video_audio_handler
-from utils.error_handler import handle_exception, ModelNotLoadedError
+from handlers.transcription_handler import transcribe_file
+from utils.error_handler import handle_exception
+from utils.job_manager import job_manager
+from utils.http_clients import close_async_clients
 from visual_analysis import visual_analyzer
-from ffmpeg_utils import cut_clip
+from ffmpeg_utils import cut_clip_smart_async
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,17 +34,27 @@ app = FastAPI(
 # Mount the videos directory to serve static files
 app.mount("/videos", StaticFiles(directory="videos"), name="videos")
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize AI models on startup"""
-    global MODELS_LOADED
+# Background warm-up task (kept referenced so it is not garbage collected)
+_preload_task = None
+
+async def _preload_models():
     try:
-        await visual_analyzer.initialize()
-        MODELS_LOADED = True
-        logger.info("AI models loaded successfully")
+        await visual_analyzer.initialize(PRELOAD_MODELS)
+        logger.info(f"Preloaded AI models: {', '.join(PRELOAD_MODELS)}")
     except Exception as e:
-        logger.error(f"Failed to load AI models: {e}")
-        MODELS_LOADED = False
+        logger.error(f"Failed to preload AI models: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    """AI models load lazily on first use; PRELOAD_MODELS are warmed up without blocking startup"""
+    global _preload_task
+    if PRELOAD_MODELS:
+        _preload_task = asyncio.create_task(_preload_models())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled upstream connections"""
+    await close_async_clients()
 
 @app.get("/health")
 async def health_check():
@@ -49,17 +62,29 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "analyzer",
-        "models_loaded": MODELS_LOADED,
+        "models_loaded": visual_analyzer.models_initialized,
+        "inference": visual_analyzer.inference_stats(),
         "timestamp": asyncio.get_event_loop().time()
     }
 
+@app.get("/ready")
+async def readiness_check(models: Optional[str] = None):
+    """Readiness per model. FFmpeg/scene endpoints are ready right after startup; with
+    ?models=blip,yolo the response is 503 until all listed models are loaded."""
+    required = [name.strip() for name in models.split(',') if name.strip()] if models else []
+    unknown = [name for name in required if name not in visual_analyzer.model_status]
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"Unknown models: {', '.join(unknown)}"})
+    ready = all(visual_analyzer.model_status[name]["status"] == "ready" for name in required)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "models": visual_analyzer.model_status}
+    )
+
 @app.post("/analyze")
 async def analyze_video(file: UploadFile = File(...)):
     """Analyze uploaded video with AI"""
     try:
-        if not MODELS_LOADED:
-            raise ModelNotLoadedError()
-        
         file_path = await save_uploaded_file(file)
         result = await analyze_video_with_ai(file_path)
         return JSONResponse(content=result)
@@ -71,9 +96,6 @@ async def analyze_video(file: UploadFile = File(...)):
 async def analyze_video_path(request: VideoPathRequest):
     """Analyze video from file path"""
     try:
-        if not MODELS_LOADED:
-            raise ModelNotLoadedError()
-        
         result = await analyze_video_with_ai(request.file)
         return JSONResponse(content=result)
     except Exception as e:
@@ -113,15 +135,16 @@ async def cutdown_video(request: CutdownRequest):
         output_filename = request.output_filename or f"cutdown_{request.file.split('/')[-1]}"
         output_path = f"{OUTPUT_DIR}/{output_filename}"
         
-        cut_clip(request.file, output_path, start_time, end_time)
+        cut_mode = await cut_clip_smart_async(request.file, output_path, start_time, end_time)
         
         # Check if cutdown was successful
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        if not cut_mode or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
             from utils.error_handler import VideoProcessingError
             raise VideoProcessingError("Cutdown failed - output file is empty or missing")
         
         return JSONResponse(content={
-            "output_url": output_path.replace('/app/videos/', '/videos/')
+            "output_url": output_path.replace('/app/videos/', '/videos/'),
+            "cut_mode": cut_mode
         })
     except Exception as e:
         http_exception = handle_exception(e)
@@ -161,30 +184,56 @@ async def generate_cutdown_v2_endpoint(request: CutdownV2Request):
 async def transcribe_audio_path(request: TranscribeRequest):
     """Transcribe audio from file path"""
     try:
-        import requests
-        import os
-        
-        # Forward to whisper service
-        whisper_url = "http://whisper:9000/asr"
-        
-        # Convert /videos/ path to /app/videos/ path
-        file_path = request.file.replace('/videos/', '/app/videos/')
-        
-        # Check if file exists before processing
-        if not os.path.exists(file_path):
-            return JSONResponse(
-                status_code=404,
-                content={"error": f"Audio file not found: {request.file}"}
-            )
-        
-        with open(file_path, 'rb') as audio_file:
-            files = {'audio_file': audio_file}
-            data = {'language_code': request.language} if request.language else {}
-            
-            response = requests.post(whisper_url, files=files, data=data)
-            response.raise_for_status()
-            
-            return JSONResponse(content=response.json())
+        result = await transcribe_file(request.file, request.language)
+        return JSONResponse(content=result)
+    except Exception as e:
+        http_exception = handle_exception(e)
+        raise http_exception
+
+# Background jobs: submit returns a job id immediately, GET /jobs/{job_id} reports
+# status, progress (0-100) and the result once the job has completed.
+# With ?video_id=... the job state is also pushed to the frontend status stream.
+
+@app.post("/jobs/analyze-path")
+async def submit_analyze_job(request: VideoPathRequest, video_id: Optional[str] = None):
+    """Submit AI analysis of a video file as a background job"""
+    try:
+        job = job_manager.submit("analyze-path", analyze_video_with_ai, request.file, video_id=video_id)
+        return JSONResponse(status_code=202, content=job.to_dict())
+    except Exception as e:
+        http_exception = handle_exception(e)
+        raise http_exception
+
+@app.post("/jobs/generate-cutdown-v2")
+async def submit_cutdown_job(request: CutdownV2Request, video_id: Optional[str] = None):
+    """Submit cutdown rendering from selected scenes as a background job"""
+    try:
+        request_data = {
+            "selected_scenes": [scene.dict() for scene in request.selected_scenes],
+            "audio_file": request.audio_file,
+            "original_video": request.original_video
+        }
+        job = job_manager.submit("generate-cutdown-v2", generate_cutdown_v2, request_data, video_id=video_id)
+        return JSONResponse(status_code=202, content=job.to_dict())
+    except Exception as e:
+        http_exception = handle_exception(e)
+        raise http_exception
+
+@app.post("/jobs/separate-path")
+async def submit_separate_job(request: VideoPathRequest, video_id: Optional[str] = None):
+    """Submit video/audio separation as a background job"""
+    try:
+        job = job_manager.submit("separate-path", separate_video_audio_handler, request.file, video_id=video_id)
+        return JSONResponse(status_code=202, content=job.to_dict())
+    except Exception as e:
+        http_exception = handle_exception(e)
+        raise http_exception
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get status, progress and result of a background job"""
+    try:
+        return JSONResponse(content=job_manager.get(job_id).to_dict())
     except Exception as e:
         http_exception = handle_exception(e)
         raise http_exception
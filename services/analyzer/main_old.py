@@ -7,11 +7,13 @@ import subprocess
 from typing import List, Union
 import os
 from scene_utils import analyze_scenes
-from ffmpeg_utils import cut_clip, separate_video_audio
+from ffmpeg_utils import cut_clip, cut_clips_async, separate_video_audio
 from visual_analysis import visual_analyzer
 import asyncio
 from pydantic import BaseModel, Field, RootModel
 import requests
+from utils.upload_stream import stream_upload_to_file
+from handlers.transcription_handler import detect_language, transcribe_file
 
 app = FastAPI()
 
@@ -176,9 +178,7 @@ async def analyze_video(file: UploadFile = File(...)):
     video_id = str(uuid.uuid4())
     video_path = os.path.join(UPLOAD_DIR, f"{video_id}_{file.filename}")
     
-    with open(video_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    await stream_upload_to_file(file, video_path)
 
     try:
         result = await _analyze_video_from_path(video_path, file.filename)
@@ -287,14 +287,11 @@ async def detect_language_from_path(file: str = Form(...)):
     if not os.path.exists(file):
         raise HTTPException(status_code=404, detail=f"Audio file not found at path: {file}")
     try:
-        with open(file, "rb") as f:
-            files = {"audio_file": f}
-            response = requests.post("http://whisper:9000/asr", files=files)
-        response.raise_for_status()
-        result = response.json()
+        # Whisper dekodiert nur die ersten Sekunden (per Pfad oder als Upload), statt alles zu transkribieren
+        result = await detect_language(file)
         return {
             "language": result.get("language", "unknown"),
-            "confidence": 1.0
+            "confidence": result.get("confidence", 0.0)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -309,24 +306,10 @@ async def transcribe_from_path(request: TranscribeRequest):
     if not os.path.exists(audio_path):
          raise HTTPException(status_code=404, detail=f"Audio file not found at path: {audio_path}")
     try:
-         with open(audio_path, "rb") as f:
-             files = {"audio_file": f}
-             data = {}
-             if language:
-                 data["language_code"] = language
-             response = requests.post("http://whisper:9000/asr", files=files, data=data)
-         response.raise_for_status()
-         print("Whisper response text:", response.text)
-         try:
-             return response.json()
-         except Exception as json_err:
-             print(f"Error parsing Whisper response as JSON: {json_err}")
-             print("Whisper response text (on error):", response.text)
-             # Fallback: Gib den Text als JSON zurück
-             return {"text": response.text.strip()}
+         # Gepoolter Whisper-Client mit Timeout passend zur Audiolänge
+         return await transcribe_file(audio_path, language)
     except Exception as e:
          print(f"Error transcribing audio: {e}")
-         print("Whisper response text (on error):", getattr(locals().get('response', None), "text", "NO RESPONSE"))
          raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/cutdown-path")
@@ -412,6 +395,7 @@ async def generate_cutdown(request: CompilationRequest):
                 raise HTTPException(status_code=404, detail=f"Video file not found at path: {base_video_path}")
             print(f"Using separated video: {base_video_path}")
     
+    cut_jobs = []
     for i, scene in enumerate(request.selected_scenes):
         print(f"Processing scene {i}: {scene.start_time} - {scene.end_time}")
         
@@ -425,12 +409,15 @@ async def generate_cutdown(request: CompilationRequest):
         scene_filename = f"{uuid.uuid4()}_scene_{i:03d}.mp4"
         scene_output_path = os.path.join(OUTPUT_DIR, scene_filename)
         
-        # Cut the scene from the original video
-        success = cut_clip(base_video_path, scene_output_path, start_seconds, end_seconds)
+        cut_jobs.append((base_video_path, scene_output_path, start_seconds, end_seconds))
+        scene_files.append(scene_output_path)
+
+    # Cut the scenes from the original video in parallel (results come back in order);
+    # re-encoded so they share codec parameters for the -c:v copy concat below
+    results = await cut_clips_async(cut_jobs, mode="reencode")
+    for i, success in enumerate(results):
         if not success:
             raise HTTPException(status_code=500, detail=f"Failed to cut scene {i}")
-        
-        scene_files.append(scene_output_path)
 
     print(f"Successfully cut {len(scene_files)} scenes")
 
@@ -464,7 +451,7 @@ async def generate_cutdown(request: CompilationRequest):
             temp_video
         ]
         print(f"Running FFmpeg concat command: {' '.join(cmd)}")
-        process = subprocess.run(cmd, capture_output=True, text=True)
+        process = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True)
         print(f"FFmpeg concat stdout: {process.stdout}")
         print(f"FFmpeg concat stderr: {process.stderr}")
         print(f"FFmpeg concat return code: {process.returncode}")
@@ -502,7 +489,7 @@ async def generate_cutdown(request: CompilationRequest):
                     "-shortest",                 # Beende wenn kürzester Stream endet
                     output_path
                 ]
-                process = subprocess.run(cmd, capture_output=True, text=True)
+                process = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True)
                 if process.returncode != 0:
                     raise HTTPException(status_code=500, detail=f"FFmpeg audio merge failed: {process.stderr}")
 
@@ -598,6 +585,7 @@ async def generate_cutdown_v2(request: dict):
                     raise HTTPException(status_code=404, detail=f"Video file not found at path: {base_video_path}")
                 print(f"Using separated video: {base_video_path}")
     
+    cut_jobs = []
     for i, scene in enumerate(selected_scenes):
         # Convert time strings to seconds for ffmpeg
         start_time = scene.get("start_time")
@@ -618,8 +606,13 @@ async def generate_cutdown_v2(request: dict):
         print(f"Scene {i} video path: {base_video_path}")
         print(f"Scene {i} time range: {start_seconds}s - {end_seconds}s (duration: {end_seconds - start_seconds}s)")
         
-        # Cut the scene from the original video
-        success = cut_clip(base_video_path, scene_output_path, start_seconds, end_seconds)
+        cut_jobs.append((base_video_path, scene_output_path, start_seconds, end_seconds))
+        scene_files.append(scene_output_path)
+
+    # Cut the scenes from the original video in parallel (results come back in order);
+    # re-encoded so they share codec parameters for the -c:v copy concat below
+    results = await cut_clips_async(cut_jobs, mode="reencode")
+    for i, (scene_output_path, success) in enumerate(zip(scene_files, results)):
         if not success:
             raise HTTPException(status_code=500, detail=f"Failed to cut scene {i}")
         
@@ -630,8 +623,6 @@ async def generate_cutdown_v2(request: dict):
         else:
             print(f"ERROR: Scene {i} file not created: {scene_output_path}")
             raise HTTPException(status_code=500, detail=f"Scene {i} file not created")
-        
-        scene_files.append(scene_output_path)
 
     # Create FFmpeg concat list file
     list_file = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_concat_list.txt")
@@ -663,7 +654,7 @@ async def generate_cutdown_v2(request: dict):
             temp_video
         ]
         print(f"Running FFmpeg concat command: {' '.join(cmd)}")
-        process = subprocess.run(cmd, capture_output=True, text=True)
+        process = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True)
         print(f"FFmpeg concat stdout: {process.stdout}")
         print(f"FFmpeg concat stderr: {process.stderr}")
         print(f"FFmpeg concat return code: {process.returncode}")
@@ -701,7 +692,7 @@ async def generate_cutdown_v2(request: dict):
                     "-shortest",                 # Beende wenn kürzester Stream endet
                     output_path
                 ]
-                process = subprocess.run(cmd, capture_output=True, text=True)
+                process = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True)
                 if process.returncode != 0:
                     raise HTTPException(status_code=500, detail=f"FFmpeg audio merge failed: {process.stderr}")
 
@@ -762,11 +753,7 @@ async def transcribe_audio_from_path(file: str = Form(...)):
     if not os.path.exists(file):
         raise HTTPException(status_code=404, detail=f"Audio file not found at path: {file}")
     try:
-        with open(file, "rb") as f:
-            files = {"audio_file": f}
-            response = requests.post("http://whisper:9000/asr", files=files)
-        response.raise_for_status()
-        return response.json()
+        return await transcribe_file(file)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,38 +1,236 @@
 # analyzer/scene_utils.py
 import cv2
 import os
-from scenedetect import VideoManager, SceneManager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from scenedetect import VideoManager, SceneManager, FrameTimecode
 from scenedetect.detectors import ContentDetector
+from scenedetect.scene_manager import compute_downscale_factor
 from datetime import timedelta
 
+# Number of candidate keyframes held per scene while streaming
+KEYFRAME_BUFFER_SIZE = int(os.getenv('SCENE_KEYFRAME_BUFFER', '32'))
+# Single decode pass for detection and keyframes (set to false for the old two-pass mode)
+STREAMING_DEFAULT = os.getenv('SCENE_STREAMING', 'true').lower() == 'true'
+# Decoded keyframes handed to on_frames at once (at most this many are held in memory)
+FRAME_BATCH_SIZE = int(os.getenv('SCENE_FRAME_BATCH', '16'))
+
+# Screenshots are only needed by the UI, so JPEG encoding runs off the decode loop
+_screenshot_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="screenshot")
+
 def resize_frame(frame, target_width=640):
     """Resize frame maintaining aspect ratio"""
     height = int(frame.shape[0] * (target_width / frame.shape[1]))
     return cv2.resize(frame, (target_width, height), interpolation=cv2.INTER_AREA)
 
-def analyze_scenes(video_path: str, threshold: float | None = None, min_scene_len: int | None = None):
+class KeyframeBuffer:
+    """Bounded buffer of evenly spaced candidate frames for the scene being decoded.
+
+    Frames are sampled every `stride` frames from the scene start. When the buffer
+    overflows, every other sample is dropped and the stride doubles, so memory stays
+    at `capacity` frames while the samples still cover the whole scene.
+    """
+    def __init__(self, capacity: int = KEYFRAME_BUFFER_SIZE):
+        self.capacity = max(2, capacity)
+        self.scene_start = 0
+        self.stride = 1
+        self.frames = deque()
+
+    def wants(self, frame_number: int) -> bool:
+        return (frame_number - self.scene_start) % self.stride == 0
+
+    def add(self, frame_number: int, frame):
+        self.frames.append((frame_number, frame))
+        if len(self.frames) > self.capacity:
+            self.stride *= 2
+            self.frames = deque(
+                (n, f) for n, f in self.frames if (n - self.scene_start) % self.stride == 0
+            )
+
+    def close_scene(self, cut_frame: int, end_frame: int | None = None):
+        """Return the buffered frame nearest the midpoint of the scene ending at `cut_frame`.
+
+        Frames at or after the cut are kept as the first candidates of the next scene.
+        """
+        end_frame = cut_frame if end_frame is None else end_frame
+        target = self.scene_start + (end_frame - self.scene_start) // 2
+        closing = [(n, f) for n, f in self.frames if n < cut_frame]
+        self.frames = deque((n, f) for n, f in self.frames if n >= cut_frame)
+        self.scene_start = cut_frame
+        self.stride = 1
+        if not closing:
+            return None
+        return min(closing, key=lambda item: abs(item[0] - target))
+
+class FrameBatcher:
+    """Collects (screenshot, frame) pairs of closed scenes and hands them to `callback`
+    in batches of `batch_size`, so frames are released once the callback has used them."""
+    def __init__(self, callback=None, batch_size: int = FRAME_BATCH_SIZE):
+        self.callback = callback
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+
+    def add(self, screenshot: dict, frame):
+        if self.callback is None:
+            return
+        self.pending.append((screenshot, frame))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.callback is not None and self.pending:
+            batch, self.pending = self.pending, []
+            self.callback(batch)
+
+def resolve_detector_params(threshold=None, min_scene_len=None):
+    """Return the effective (threshold, min_scene_len) for the ContentDetector"""
+    # Allow tuning sensitivity via parameters or environment variables
+    env_threshold = float(os.getenv('SCENE_THRESHOLD', '18'))
+    env_min_len = int(os.getenv('SCENE_MIN_LEN', '8'))
+    detector_threshold = float(threshold) if threshold is not None else env_threshold
+    detector_min_len = int(min_scene_len) if min_scene_len is not None else env_min_len
+    return detector_threshold, detector_min_len
+
+def _save_screenshot(frame, screenshots_dir, video_name, scene_idx, frame_idx, writes):
+    """Queue a (resized) frame for JPEG writing and return its path and public URL"""
+    screenshot_path = os.path.join(screenshots_dir, f'scene_{scene_idx:03d}_frame_{frame_idx:03d}.jpg')
+    writes.append(_screenshot_writer.submit(cv2.imwrite, screenshot_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85]))
+    screenshot_url = f'/videos/screenshots/{video_name}/scene_{scene_idx:03d}_frame_{frame_idx:03d}.jpg'
+    return screenshot_path, screenshot_url
+
+def analyze_scenes(video_path: str, threshold: float | None = None, min_scene_len: int | None = None,
+                   streaming: bool | None = None, on_frames=None, progress=None,
+                   screenshots_name: str | None = None):
+    """Detect scenes and save one representative screenshot per scene.
+
+    on_frames(batch) is called from the decoding thread with lists of
+    (screenshot dict, BGR frame) pairs as scenes close, so callers can run models on
+    the decoded frames without reading the JPEGs back from disk and without holding
+    every frame of the video; the dicts are the ones in the returned scenes.
+    progress(fraction) is called
+    with the share of frames decoded so far. Screenshots go to
+    screenshots/<screenshots_name>/ (default: the video's file name).
+    """
     # Create screenshots directory if it doesn't exist
-    video_name = os.path.splitext(os.path.basename(video_path))[0]
-    
+    video_name = screenshots_name or os.path.splitext(os.path.basename(video_path))[0]
+
     # Fix: Always save screenshots to /app/videos/screenshots/ regardless of video location
     base_videos_dir = "/app/videos"
     screenshots_dir = os.path.join(base_videos_dir, 'screenshots', video_name)
     os.makedirs(screenshots_dir, exist_ok=True)
 
+    detector_threshold, detector_min_len = resolve_detector_params(threshold, min_scene_len)
+    if streaming is None:
+        streaming = STREAMING_DEFAULT
+    writes = []
+    batcher = FrameBatcher(on_frames)
+    try:
+        if streaming:
+            result = _analyze_scenes_streaming(video_path, video_name, screenshots_dir,
+                                               detector_threshold, detector_min_len, writes, batcher, progress)
+        else:
+            result = _analyze_scenes_two_pass(video_path, video_name, screenshots_dir,
+                                              detector_threshold, detector_min_len, writes, batcher)
+        batcher.flush()
+    finally:
+        # Screenshot URLs are handed out with the result, so the files must exist by then
+        wait(writes)
+    if progress is not None:
+        progress(1.0)
+    return result
+
+def _analyze_scenes_streaming(video_path, video_name, screenshots_dir, detector_threshold, detector_min_len,
+                              writes, batcher, progress=None):
+    """Detect scenes and capture their midpoint frames in a single decode pass.
+
+    Every frame is fed to the ContentDetector directly (downscaled the same way
+    SceneManager does), while candidate keyframes for the current scene are kept
+    in a KeyframeBuffer. No second capture and no random seeks are needed.
+    """
+    detector = ContentDetector(threshold=detector_threshold, min_scene_len=detector_min_len)
+    buffer = KeyframeBuffer()
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    downscale = compute_downscale_factor(frame_width) if frame_width > 0 else 1
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    cuts = []
+    result = []
+
+    def close_scene(cut_frame, end_frame=None):
+        # The scene is complete: pick its keyframe and queue the screenshot right away
+        i = len(result)
+        start_frame = cuts[-1] if cuts else 0
+        end_frame = cut_frame if end_frame is None else end_frame
+        keyframe = buffer.close_scene(cut_frame, end_frame)
+
+        scene_screenshots = []
+        if keyframe is not None:
+            keyframe_number, frame = keyframe
+            screenshot_path, screenshot_url = _save_screenshot(frame, screenshots_dir, video_name, i, 0, writes)
+            scene_screenshots.append({
+                "url": screenshot_url,
+                "path": screenshot_path,
+                "timestamp": str(timedelta(seconds=keyframe_number / fps)),
+                "frame_number": keyframe_number
+            })
+            batcher.add(scene_screenshots[0], frame)
+
+        result.append({
+            "scene": i,
+            "start_time": FrameTimecode(start_frame, fps=fps).get_timecode(),
+            "end_time": FrameTimecode(end_frame, fps=fps).get_timecode(),
+            "screenshots": scene_screenshots
+        })
+
+    frame_number = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            if buffer.wants(frame_number):
+                buffer.add(frame_number, resize_frame(frame))
+
+            detect_frame = frame
+            if downscale > 1:
+                height, width = frame.shape[:2]
+                detect_frame = cv2.resize(frame, (round(width / downscale), round(height / downscale)),
+                                          interpolation=cv2.INTER_LINEAR)
+            for cut in detector.process_frame(frame_number, detect_frame) or []:
+                close_scene(int(cut))
+                cuts.append(int(cut))
+
+            frame_number += 1
+            if progress is not None and total_frames > 0 and frame_number % 100 == 0:
+                progress(min(1.0, frame_number / total_frames))
+
+        if hasattr(detector, 'post_process'):
+            for cut in detector.post_process(frame_number) or []:
+                close_scene(int(cut))
+                cuts.append(int(cut))
+    finally:
+        cap.release()
+
+    # Same semantics as SceneManager.get_scene_list(): no cuts means no scenes
+    if not cuts:
+        return []
+    close_scene(frame_number, frame_number)
+    return result
+
+def _analyze_scenes_two_pass(video_path, video_name, screenshots_dir, detector_threshold, detector_min_len, writes,
+                             batcher):
     # Open video for both scene detection and frame capture
     video_manager = VideoManager([video_path])
     scene_manager = SceneManager()
-    # Allow tuning sensitivity via parameters or environment variables
-    env_threshold = float(os.getenv('SCENE_THRESHOLD', '18'))
-    env_min_len = int(os.getenv('SCENE_MIN_LEN', '8'))
-    detector_threshold = float(threshold) if threshold is not None else env_threshold
-    detector_min_len = int(min_scene_len) if min_scene_len is not None else env_min_len
     scene_manager.add_detector(ContentDetector(threshold=detector_threshold, min_scene_len=detector_min_len))
 
     # Open video for frame capture
     cap = cv2.VideoCapture(video_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_interval = int(fps * 1.0)  # Capture every ~1.0 seconds for denser sampling
 
     video_manager.set_downscale_factor()
     video_manager.start()
@@ -45,38 +243,37 @@ def analyze_scenes(video_path: str, threshold: float | None = None, min_scene_le
         # Calculate frame numbers for screenshots
         start_frame = int(start.get_frames())
         end_frame = int(end.get_frames())
-        
+
         # OPTIMIZATION: To prevent timeouts, we now only analyze one representative
         # screenshot from the middle of each scene.
         frame_numbers = [start_frame + (end_frame - start_frame) // 2]
         if not frame_numbers: # Ensure at least one frame is processed for very short scenes
             frame_numbers = [start_frame]
-        
+
         scene_screenshots = []
         for frame_idx, frame_number in enumerate(frame_numbers):
             # Set video position to the frame we want
             cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
             ret, frame = cap.read()
-            
+
             if ret:
                 # Resize frame
                 frame = resize_frame(frame)
-                
+
                 # Save screenshot with compression
-                screenshot_path = os.path.join(screenshots_dir, f'scene_{i:03d}_frame_{frame_idx:03d}.jpg')
-                cv2.imwrite(screenshot_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                
+                screenshot_path, screenshot_url = _save_screenshot(frame, screenshots_dir, video_name, i, frame_idx, writes)
+
                 # Calculate timestamp for this frame
                 timestamp = start.get_seconds() + (frame_number - start_frame) / fps
                 time_str = str(timedelta(seconds=timestamp))
-                
-                screenshot_url = f'/videos/screenshots/{video_name}/scene_{i:03d}_frame_{frame_idx:03d}.jpg'
+
                 scene_screenshots.append({
                     "url": screenshot_url,
                     "path": screenshot_path,
                     "timestamp": time_str,
                     "frame_number": frame_number
                 })
+                batcher.add(scene_screenshots[-1], frame)
 
         result.append({
             "scene": i,
@@ -84,7 +281,7 @@ def analyze_scenes(video_path: str, threshold: float | None = None, min_scene_le
             "end_time": end.get_timecode(),
             "screenshots": scene_screenshots
         })
-    
+
     # Cleanup
     video_manager.release()
     cap.release()
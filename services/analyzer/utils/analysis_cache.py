@@ -0,0 +1,146 @@
+# utils/analysis_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+from config import ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_ENABLED, ANALYSIS_CACHE_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached result format changes
+CACHE_FORMAT_VERSION = 2
+# Read size while hashing a file for its fingerprint
+FINGERPRINT_CHUNK_SIZE = 4 * 1024 * 1024
+# Fingerprints by (path, size, mtime), so an upload fingerprinted at ingestion is not read again
+_fingerprints: "OrderedDict[tuple, str]" = OrderedDict()
+_fingerprints_lock = threading.Lock()
+MAX_REMEMBERED_FINGERPRINTS = 1024
+
+def new_fingerprint_digest():
+    """Hash object for fingerprints (lets upload ingestion fingerprint a file while writing it)"""
+    return hashlib.blake2b(digest_size=20)
+
+def _identity(path: str):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+def remember_fingerprint(path: str, fingerprint: str) -> None:
+    """Record the fingerprint of a file whose content was hashed elsewhere"""
+    identity = _identity(path)
+    with _fingerprints_lock:
+        _fingerprints[identity] = fingerprint
+        _fingerprints.move_to_end(identity)
+        while len(_fingerprints) > MAX_REMEMBERED_FINGERPRINTS:
+            _fingerprints.popitem(last=False)
+
+def fingerprint_file(path: str) -> str:
+    """Content fingerprint: hash of the whole file.
+
+    Every byte counts, so files of the same size that differ anywhere (e.g. two
+    re-encodes of one master) never share cache entries. The result is remembered
+    per (path, size, mtime); uploads are fingerprinted while they are written.
+    """
+    identity = _identity(path)
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(identity)
+    if fingerprint is None:
+        digest = new_fingerprint_digest()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(FINGERPRINT_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()
+        remember_fingerprint(path, fingerprint)
+    return fingerprint
+
+class AnalysisCache:
+    """Persistent JSON result cache on the shared volume with size-bounded LRU eviction.
+
+    Each entry is one file named after its key; the file mtime is refreshed on every
+    hit and the oldest entries are removed once the directory exceeds max_bytes.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def make_key(self, fingerprint: str, **params: Any) -> str:
+        """Build a cache key from a content fingerprint and the parameters that affect the result"""
+        material = json.dumps({"v": CACHE_FORMAT_VERSION, "fingerprint": fingerprint, **params},
+                              sort_keys=True, default=str)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f)
+            os.utime(path)  # mark as recently used
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            self.delete(key)
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith('.json'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+                if total <= self.max_bytes:
+                    break
+
+# Singleton instance
+analysis_cache = AnalysisCache(ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX_MB * 1024 * 1024, ANALYSIS_CACHE_ENABLED)
@@ -23,11 +23,26 @@ class ModelNotLoadedError(GenCutException):
     def __init__(self, message: str = "AI models are not loaded"):
         super().__init__(message, 503)
 
+class InferenceBusyError(GenCutException):
+    """Error when too many analyses are waiting for a model"""
+    def __init__(self, model: str):
+        super().__init__(f"Too many requests waiting for the {model} model, retry later", 503, {"model": model})
+
 class FileNotFoundError(GenCutException):
     """Error when file is not found"""
     def __init__(self, file_path: str):
         super().__init__(f"File not found: {file_path}", 404, {"file_path": file_path})
 
+class JobNotFoundError(GenCutException):
+    """Error when a background job id is unknown"""
+    def __init__(self, job_id: str):
+        super().__init__(f"Job not found: {job_id}", 404, {"job_id": job_id})
+
+class TranscriptionError(GenCutException):
+    """Error returned by (or while reaching) the whisper service"""
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message, status_code)
+
 def handle_exception(e: Exception) -> HTTPException:
     """Convert exceptions to HTTP exceptions with proper logging"""
     if isinstance(e, GenCutException):
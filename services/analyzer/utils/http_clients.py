@@ -0,0 +1,10 @@
+# utils/http_clients.py
+import os
+import sys
+
+# Shared libraries are mounted at /app/shared (see docker-compose.yml)
+sys.path.append(os.environ.get('SHARED_LIB_DIR', '/app/shared'))
+
+from http_client import CircuitOpenError, close_async_clients, get_async_client, get_client  # noqa: E402
+
+__all__ = ["CircuitOpenError", "close_async_clients", "get_async_client", "get_client"]
@@ -0,0 +1,155 @@
+# utils/job_manager.py
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import requests
+
+from utils.error_handler import GenCutException, JobNotFoundError
+from utils.http_clients import get_client
+
+logger = logging.getLogger(__name__)
+
+# Number of jobs executed at the same time; further jobs wait in "queued"
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# Number of jobs kept for status lookups (oldest finished jobs are dropped first)
+JOB_HISTORY = int(os.environ.get('JOB_HISTORY', '500'))
+# Frontend endpoint that pushes job status to the browser (jobs submitted with a video_id)
+STATUS_PUBLISH_URL = os.environ.get('STATUS_PUBLISH_URL', 'http://gencut-frontend:5679/status-events')
+# Shared secret expected by the frontend's /status-events route
+STATUS_EVENTS_TOKEN = os.environ.get('STATUS_EVENTS_TOKEN', '')
+# Progress is published in steps of this many percent
+STATUS_PUBLISH_STEP = 10
+
+# Publishing is fire-and-forget; one thread keeps the events of a job in order
+_status_publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="status-publish")
+
+ProgressCallback = Callable[[float], None]
+
+def scaled_progress(progress: Optional[ProgressCallback], start: float, end: float) -> Optional[ProgressCallback]:
+    """Map a 0..1 progress callback of one step onto the [start, end] share of the whole job"""
+    if progress is None:
+        return None
+    return lambda fraction: progress(start + (end - start) * fraction)
+
+class Job:
+    """State of one background job"""
+    def __init__(self, kind: str, video_id: Optional[str] = None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.video_id = video_id
+        self.status = "queued"
+        self.progress = 0.0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._published_step = -1
+
+    def update_progress(self, fraction: float) -> None:
+        """Progress callback handed to the job function (may be called from worker threads)"""
+        self.progress = max(self.progress, min(100.0, round(fraction * 100, 1)))
+        step = int(self.progress // STATUS_PUBLISH_STEP)
+        if step > self._published_step:
+            self._published_step = step
+            self.publish()
+
+    def publish(self) -> None:
+        """Push the current state to the frontend status stream of the job's video"""
+        if not self.video_id or not STATUS_PUBLISH_URL:
+            return
+        _status_publisher.submit(_post_status, self.video_id, self.to_dict())
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "video_id": self.video_id,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+def _post_status(video_id: str, payload: Dict[str, Any]) -> None:
+    try:
+        headers = {"X-Status-Token": STATUS_EVENTS_TOKEN} if STATUS_EVENTS_TOKEN else None
+        get_client('frontend').post(f"{STATUS_PUBLISH_URL}/{video_id}", params={"event": "job"}, json=payload,
+                                    headers=headers, timeout=2)
+    except requests.RequestException as e:
+        logger.debug(f"Could not publish job status for {video_id}: {e}")
+
+class JobManager:
+    """Runs long analysis/render calls in the background and keeps their status.
+
+    Job functions are coroutines that accept a `progress` keyword argument.
+    Jobs submitted with a video_id also publish their state changes to the
+    frontend, which pushes them to the browser as "job" events.
+    """
+    def __init__(self, max_concurrent: int = JOB_WORKERS, history: int = JOB_HISTORY):
+        self.max_concurrent = max(1, max_concurrent)
+        self.history = max(1, history)
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    def submit(self, kind: str, func: Callable[..., Awaitable[Any]], *args: Any,
+               video_id: Optional[str] = None) -> Job:
+        job = Job(kind, video_id)
+        self.jobs[job.id] = job
+        self._prune()
+        task = asyncio.create_task(self._run(job, func, args))
+        # Keep a reference so the task is not garbage collected while running
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        job.publish()
+        return job
+
+    def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(job_id)
+        return job
+
+    async def _run(self, job: Job, func: Callable[..., Awaitable[Any]], args: tuple) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        async with self._semaphore:
+            job.status = "running"
+            job.started_at = time.time()
+            job.publish()
+            try:
+                job.result = await func(*args, progress=job.update_progress)
+                job.progress = 100.0
+                job.status = "completed"
+            except Exception as e:
+                job.error = e.message if isinstance(e, GenCutException) else str(e)
+                job.status = "failed"
+                logger.error(f"Job {job.id} ({job.kind}) failed: {job.error}")
+            finally:
+                job.finished_at = time.time()
+                job.publish()
+
+    def _prune(self) -> None:
+        """Drop the oldest finished jobs once more than `history` jobs are stored"""
+        excess = len(self.jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished][:excess]:
+            del self.jobs[job_id]
+
+# Singleton instance
+job_manager = JobManager()
@@ -0,0 +1,80 @@
+# utils/upload_stream.py
+import asyncio
+import os
+from typing import Any, Dict
+
+from fastapi import UploadFile
+
+from ffmpeg_utils import probe_media, probe_media_header, remember_media_info
+from utils.analysis_cache import new_fingerprint_digest, remember_fingerprint
+
+# Size of the chunks copied from the spooled upload to its destination
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE_KB', '1024')) * 1024
+# Leading bytes handed to ffprobe while the rest of the upload is still being copied
+UPLOAD_SNIFF_BYTES = 4 * 1024 * 1024
+
+def _write_chunk(out, digest, chunk: bytes) -> None:
+    out.write(chunk)
+    digest.update(chunk)
+
+async def stream_upload_to_file(file: UploadFile, dest_path: str) -> Dict[str, Any]:
+    """Copy an upload to dest_path chunk by chunk, fingerprinting and probing it on the way.
+
+    Starlette has already spooled the request body to a temporary file, so this is
+    the one copy into the upload directory. At most two chunks are held in memory
+    (the one being written and the next one being read), whatever the size of the
+    upload. The analysis fingerprint is computed from the bytes being copied and the
+    ffprobe metadata from the leading bytes; both are remembered, so analyzing the
+    file later neither hashes nor probes it again.
+    """
+    digest = new_fingerprint_digest()
+    header = bytearray()
+    sniff_task = None
+    pending_write = None
+    size = 0
+    try:
+        with open(dest_path, "wb") as out:
+            try:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    # Keep writes in order: the next one starts after the previous finished
+                    if pending_write is not None:
+                        await pending_write
+                        pending_write = None
+                    if not chunk:
+                        break
+                    size += len(chunk)
+
+                    if sniff_task is None:
+                        header += chunk[:UPLOAD_SNIFF_BYTES - len(header)]
+                        if len(header) >= UPLOAD_SNIFF_BYTES:
+                            sniff_task = asyncio.create_task(asyncio.to_thread(probe_media_header, bytes(header)))
+                            header = bytearray()
+
+                    pending_write = asyncio.create_task(asyncio.to_thread(_write_chunk, out, digest, chunk))
+            finally:
+                # Never close the file under a running write
+                if pending_write is not None:
+                    await asyncio.gather(pending_write, return_exceptions=True)
+    except BaseException:
+        if sniff_task is not None:
+            sniff_task.cancel()
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+
+    media = await sniff_task if sniff_task is not None else None
+    if media is None:
+        # Small file, or a container whose index is at the end (e.g. MP4 without faststart)
+        media = await asyncio.to_thread(probe_media, dest_path)
+    else:
+        remember_media_info(dest_path, media)
+    fingerprint = digest.hexdigest()
+    remember_fingerprint(dest_path, fingerprint)
+
+    return {
+        "path": dest_path,
+        "size": size,
+        "fingerprint": fingerprint,
+        "media": media
+    }
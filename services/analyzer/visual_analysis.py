@@ -1,130 +1,303 @@
-import torch
-from transformers import AutoProcessor, AutoModelForVision2Seq
-from ultralytics import YOLO
 import numpy as np
 from PIL import Image
 import cv2
 import os
+import time
 import asyncio
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from handlers.transcription_handler import transcribe_file
+from utils.error_handler import ModelNotLoadedError, InferenceBusyError
+
+# torch, transformers and ultralytics are imported only when a model is loaded,
+# so the analyzer starts (and serves FFmpeg/scene endpoints) without them
+
+# Maximum number of images per BLIP generate / YOLO predict call
+ANALYSIS_BATCH_SIZE = int(os.environ.get('ANALYSIS_BATCH_SIZE', '16'))
+
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+YOLO_MODEL_NAME = "yolov8n.pt"
+MODEL_NAMES = ("blip", "yolo")
+
+# BLIP generate settings; descriptions are only matched against keywords afterwards,
+# so cheaper profiles often give the same category/action (see benchmark_blip.py)
+BLIP_DECODE_PROFILES = {
+    "beam5": {"max_length": 50, "num_beams": 5},
+    "beam2": {"max_length": 50, "num_beams": 2},
+    "greedy": {"max_length": 50, "num_beams": 1},
+    "greedy-capped": {"max_new_tokens": 20, "num_beams": 1},
+}
+BLIP_DECODE_PROFILE = os.environ.get('BLIP_DECODE_PROFILE', 'beam5')
+# "int8": dynamically quantized Linear layers (CPU only)
+BLIP_QUANTIZATION = os.environ.get('BLIP_QUANTIZATION', '').lower() or None
+# torch intra-op threads (0 keeps the torch default of one per core)
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', '0'))
+# Batches queued on a model's inference thread behind the running one; further
+# calls wait without submitting, and beyond INFERENCE_MAX_WAITING they are rejected (503)
+INFERENCE_QUEUE_SIZE = int(os.environ.get('INFERENCE_QUEUE_SIZE', '2'))
+INFERENCE_MAX_WAITING = int(os.environ.get('INFERENCE_MAX_WAITING', '16'))
 
 class VisualAnalyzer:
-    def __init__(self):
-        self.models_initialized = False
+    def __init__(self, max_batch_size: int = ANALYSIS_BATCH_SIZE, decode_profile: str = BLIP_DECODE_PROFILE,
+                 quantization: str = BLIP_QUANTIZATION):
+        if decode_profile not in BLIP_DECODE_PROFILES:
+            raise ValueError(f"Unknown BLIP decode profile '{decode_profile}', "
+                             f"expected one of {', '.join(BLIP_DECODE_PROFILES)}")
+        self.max_batch_size = max(1, max_batch_size)
+        self.decode_profile = decode_profile
+        self.quantization = quantization
         self.scene_description_model = None
         self.scene_processor = None
         self.object_detection_model = None
-        self._initialization_lock = asyncio.Lock()
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"VisualAnalyzer initialized, will use device: {self.device}")
+        # Chosen when BLIP is loaded
+        self.device = None
+        # Per-model state: not_loaded, loading, ready or failed
+        self.model_status = {
+            name: {"status": "not_loaded", "error": None, "load_seconds": None} for name in MODEL_NAMES
+        }
+        self._model_locks = {name: asyncio.Lock() for name in MODEL_NAMES}
+        self._loaders = {"blip": self._load_blip, "yolo": self._load_yolo}
+        # One inference thread per model: the event loop never blocks on BLIP/YOLO,
+        # both models run at the same time, and each serves its batches in FIFO
+        # order (neither model object is used from two threads at once)
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-inference") for name in MODEL_NAMES
+        }
+        self._slots = {name: asyncio.Semaphore(1 + INFERENCE_QUEUE_SIZE) for name in MODEL_NAMES}
+        self._pending = {name: 0 for name in MODEL_NAMES}
+        self._waiting = {name: 0 for name in MODEL_NAMES}
 
-    async def initialize(self):
-        """Initialize the AI models asynchronously"""
-        if self.models_initialized:
-            print("Models already initialized")
-            return
+    @property
+    def models_initialized(self) -> bool:
+        return all(status["status"] == "ready" for status in self.model_status.values())
 
-        async with self._initialization_lock:
-            if self.models_initialized:  # Double-check after acquiring lock
-                print("Models already initialized (double-check)")
-                return
+    @property
+    def model_version(self) -> dict:
+        """Models and decoding settings that determine the analysis output (used for cache keys)"""
+        version = {
+            "blip": BLIP_MODEL_NAME,
+            "yolo": YOLO_MODEL_NAME,
+            "decoding": BLIP_DECODE_PROFILES[self.decode_profile]
+        }
+        if self.quantization:
+            version["quantization"] = self.quantization
+        return version
+
+    async def initialize(self, models=MODEL_NAMES):
+        """Load the given models (all by default) concurrently; already loaded ones are skipped"""
+        await asyncio.gather(*(self.ensure_model(name) for name in models))
 
+    async def ensure_model(self, name: str):
+        """Load one model on first use (in a thread, so the event loop stays free)"""
+        status = self.model_status[name]
+        if status["status"] == "ready":
+            return
+        async with self._model_locks[name]:
+            if status["status"] == "ready":  # Double-check after acquiring lock
+                return
+            status.update(status="loading", error=None)
+            started = time.monotonic()
             try:
-                print("Starting model initialization...")
-                # Initialize models in a thread pool to avoid blocking
-                await asyncio.to_thread(self._initialize_models)
-                self.models_initialized = True
-                print(f"Models initialized successfully on device: {self.device}")
+                await asyncio.to_thread(self._loaders[name])
             except Exception as e:
-                print(f"Error during model initialization: {e}")
-                raise
+                # A later request tries again
+                status.update(status="failed", error=str(e))
+                print(f"Error loading {name} model: {e}")
+                raise ModelNotLoadedError(f"{name} model could not be loaded: {e}")
+            status.update(status="ready", load_seconds=round(time.monotonic() - started, 1))
+            print(f"{name} model loaded in {status['load_seconds']}s")
+
+    def inference_stats(self) -> dict:
+        """Inference calls submitted (running or queued) and waiting for a slot, per model"""
+        return {
+            name: {"pending": self._pending[name], "waiting": self._waiting[name],
+                   "max_pending": 1 + INFERENCE_QUEUE_SIZE, "max_waiting": INFERENCE_MAX_WAITING}
+            for name in MODEL_NAMES
+        }
 
-    def _initialize_models(self):
-        """Initialize the AI models (called from a thread)"""
-        print("Loading BLIP model...")
-        # Initialize BLIP for scene description (using a smaller model)
+    async def _run_inference(self, name: str, func, *args):
+        """Run a blocking model call on the model's inference thread.
+
+        At most 1 + INFERENCE_QUEUE_SIZE calls are submitted per model; later callers
+        wait for a slot (FIFO), and once INFERENCE_MAX_WAITING are waiting new calls
+        raise InferenceBusyError instead of piling up.
+        """
+        slots = self._slots[name]
+        if slots.locked():
+            if self._waiting[name] >= INFERENCE_MAX_WAITING:
+                raise InferenceBusyError(name)
+            self._waiting[name] += 1
+            try:
+                await slots.acquire()
+            finally:
+                self._waiting[name] -= 1
+        else:
+            await slots.acquire()
+        self._pending[name] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executors[name], func, *args)
+        finally:
+            self._pending[name] -= 1
+            slots.release()
+
+    def _load_blip(self):
+        """Load BLIP for scene description (called from a thread)"""
+        import torch
         from transformers import BlipProcessor, BlipForConditionalGeneration
-        self.scene_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-        self.scene_description_model = (
-            BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
-            .to(self.device)
-            .eval()  # Set to evaluation mode
-        )
-        print("BLIP model loaded successfully")
+
+        if TORCH_NUM_THREADS > 0:
+            torch.set_num_threads(TORCH_NUM_THREADS)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"Loading BLIP model on device: {self.device}")
+        self.scene_processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+        model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME).eval()  # Set to evaluation mode
+        if self.quantization == "int8":
+            if self.device == "cpu":
+                # int8 weights for all Linear layers, activations quantized on the fly
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            else:
+                print("BLIP int8 quantization is CPU only, using the full-precision model")
+        self.scene_description_model = model.to(self.device)
+
+    def _load_yolo(self):
+        """Load YOLO for object detection (called from a thread)"""
+        from ultralytics import YOLO
 
         print("Loading YOLO model...")
-        # Initialize YOLO for object detection
-        self.object_detection_model = YOLO('yolov8n.pt')
-        print("YOLO model loaded successfully")
+        self.object_detection_model = YOLO(YOLO_MODEL_NAME)
 
     async def analyze_image(self, image_path: str) -> dict:
         """Analyze a single image and return comprehensive results"""
         try:
-            # Read image
-            image = Image.open(image_path).convert('RGB')
-            
-            # Get scene description
-            description = await self._get_scene_description(image)
-            
-            # Detect objects
-            objects = await self._detect_objects(image_path)
-            
-            # Get category and action (now sync)
-            category = self._categorize_scene(description, objects)
-            action = self._detect_action(description, objects)
-            
-            # Calculate importance (now sync)
-            importance = self._calculate_importance(description, objects, category, action)
-            
-            # Return results as a simple dictionary
-            return {
-                "description": str(description),
-                "objects": [{
-                    "class": str(obj["class"]),
-                    "confidence": float(obj["confidence"]),
-                    "position": [float(x) for x in obj["position"]]
-                } for obj in objects],
-                "category": str(category),
-                "action": str(action),
-                "importance_score": float(importance)
-            }
+            results = await self.analyze_images([image_path])
+            return results[0]
         except Exception as e:
             print(f"Error in analyze_image: {e}")
             raise
 
+    async def analyze_images(self, images: list, progress=None) -> list:
+        """Analyze a batch of images, one result dict per image (in input order).
+
+        Images may be file paths or decoded BGR frames (numpy arrays, as returned by
+        analyze_scenes(on_frames=...)); frames are used in place without a JPEG
+        round trip. Images are processed in chunks of max_batch_size: each chunk is
+        captioned with a single BLIP generate call and detected with a single YOLO call,
+        both on their inference threads, while the next chunk is being decoded.
+        progress(fraction) is called after each chunk.
+        """
+        await self.initialize()
+        chunks = [images[offset:offset + self.max_batch_size] for offset in range(0, len(images), self.max_batch_size)]
+        next_chunk = asyncio.ensure_future(asyncio.to_thread(self._prepare_chunk, chunks[0])) if chunks else None
+        try:
+            results = []
+            for index in range(len(chunks)):
+                chunk = await next_chunk
+                # Decode the next chunk while this one is on the models
+                if index + 1 < len(chunks):
+                    next_chunk = asyncio.ensure_future(asyncio.to_thread(self._prepare_chunk, chunks[index + 1]))
+
+                descriptions, objects_per_image = await asyncio.gather(
+                    self._get_scene_descriptions([rgb for rgb, _ in chunk]),
+                    self._detect_objects_batch([source for _, source in chunk])
+                )
+
+                for description, objects in zip(descriptions, objects_per_image):
+                    results.append(self._build_result(description, objects))
+                if progress is not None:
+                    progress(len(results) / len(images))
+            return results
+        except Exception as e:
+            if next_chunk is not None and not next_chunk.done():
+                next_chunk.cancel()
+            print(f"Error in analyze_images: {e}")
+            raise
+
+    def _prepare_chunk(self, images: list) -> list:
+        return [self._prepare_image(image) for image in images]
+
+    def _prepare_image(self, image):
+        """Return (RGB input for BLIP, input for YOLO) for a path or BGR frame"""
+        if isinstance(image, np.ndarray):
+            # YOLO takes BGR arrays as-is; BLIP needs RGB
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB), image
+        pil_image = Image.open(image).convert('RGB')
+        return pil_image, pil_image
+
+    def _build_result(self, description: str, objects: list) -> dict:
+        """Derive category, action and importance and return the result dictionary"""
+        # Get category and action (now sync)
+        category = self._categorize_scene(description, objects)
+        action = self._detect_action(description, objects)
+        
+        # Calculate importance (now sync)
+        importance = self._calculate_importance(description, objects, category, action)
+        
+        # Return results as a simple dictionary
+        return {
+            "description": str(description),
+            "objects": [{
+                "class": str(obj["class"]),
+                "confidence": float(obj["confidence"]),
+                "position": [float(x) for x in obj["position"]]
+            } for obj in objects],
+            "category": str(category),
+            "action": str(action),
+            "importance_score": float(importance)
+        }
+
     async def _get_scene_description(self, image: Image.Image) -> str:
         """Generate natural language description of the scene"""
+        descriptions = await self._get_scene_descriptions([image])
+        return descriptions[0]
+
+    async def _get_scene_descriptions(self, images: list) -> list:
+        """Generate descriptions for a batch of images with one BLIP generate call"""
         try:
-            inputs = self.scene_processor(image, return_tensors="pt").to(self.device)
-            with torch.no_grad():
-                generated_ids = self.scene_description_model.generate(
-                    pixel_values=inputs.pixel_values,
-                    max_length=50,
-                    num_beams=5
-                )
-            return self.scene_processor.batch_decode(generated_ids, skip_special_tokens=True)[0].strip()
+            return await self._run_inference("blip", self._describe, images)
         except Exception as e:
             print(f"Error in scene description: {e}")
             raise
 
+    def _describe(self, images: list, decode_profile: str = None) -> list:
+        """BLIP captions for a batch of RGB images (blocking)"""
+        import torch
+
+        inputs = self.scene_processor(images=images, return_tensors="pt").to(self.device)
+        with torch.no_grad():
+            generated_ids = self.scene_description_model.generate(
+                pixel_values=inputs.pixel_values,
+                **BLIP_DECODE_PROFILES[decode_profile or self.decode_profile]
+            )
+        return [text.strip() for text in self.scene_processor.batch_decode(generated_ids, skip_special_tokens=True)]
+
     async def _detect_objects(self, image_path):
         """Detect objects in the scene using YOLO"""
+        objects_per_image = await self._detect_objects_batch([image_path])
+        return objects_per_image[0]
+
+    async def _detect_objects_batch(self, images: list) -> list:
+        """Detect objects in a batch of images with one YOLO call (one list per image)"""
         try:
-            results = self.object_detection_model(image_path)
-            objects = []
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    objects.append({
-                        "class": result.names[int(box.cls[0])],
-                        "confidence": float(box.conf[0]),
-                        "position": box.xyxy[0].tolist()
-                    })
-            return objects
+            return await self._run_inference("yolo", self._detect, images)
         except Exception as e:
             print(f"Error in object detection: {e}")
             raise
 
+    def _detect(self, images: list) -> list:
+        """YOLO detections for a batch of images (blocking)"""
+        results = self.object_detection_model(images, verbose=False)
+        objects_per_image = []
+        for result in results:
+            objects = []
+            boxes = result.boxes
+            for box in boxes:
+                objects.append({
+                    "class": result.names[int(box.cls[0])],
+                    "confidence": float(box.conf[0]),
+                    "position": box.xyxy[0].tolist()
+                })
+            objects_per_image.append(objects)
+        return objects_per_image
+
     def _categorize_scene(self, description, objects):
         """Categorize the scene based on description and objects"""
         try:
@@ -216,12 +389,8 @@ class VisualAnalyzer:
 
     async def _transcribe_audio(self, audio_path: str) -> str:
         """Transkribiere das Audio über den Whisper-Docker-Service."""
-        url = "http://whisper:9000/asr"
-        with open(audio_path, "rb") as f:
-            files = {"audio_file": f}
-            response = requests.post(url, files=files)
-        response.raise_for_status()
-        return response.json().get("text", "")
+        result = await transcribe_file(audio_path)
+        return result.get("text", "")
 
 # Create a singleton instance
 visual_analyzer = VisualAnalyzer() 
\ No newline at end of file
@@ -1,5 +1,5 @@
 import os
-from flask import Flask, request, render_template, jsonify, send_file, send_from_directory
+from flask import Flask, request, render_template, jsonify, send_file, send_from_directory, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import requests
 import logging
@@ -9,8 +9,20 @@ import json
 from pathlib import Path
 import uuid
 import time
-from pydantic import BaseModel
+import hmac
+import threading
+import tempfile
+from pydantic import BaseModel, ValidationError
+from urllib.parse import urlparse
 from fastapi import HTTPException
+from utils.status_events import status_broker, is_terminal_status
+
+# Import shared libraries
+import sys
+sys.path.append('/app/shared')
+from resumable_upload import ResumableUploadStore, ResumableUploadError
+from metadata_store import MetadataStore
+from http_client import get_client
 
 # Logging konfigurieren
 logging.basicConfig(level=logging.DEBUG)
@@ -30,6 +42,9 @@ MAX_CONTENT_LENGTH = 2 * 1024 * 1024 * 1024  # 2GB max file size
 ELEVENLABS_API_KEY = os.environ.get('ELEVENLABS_API_KEY', 'your-api-key-here')
 ELEVENLABS_BASE_URL = 'https://api.elevenlabs.io/v1'
 
+# Whisper-Service (Spracherkennung)
+WHISPER_URL = os.environ.get('WHISPER_URL', 'http://whisper:9000')
+
 # Umgebungsbasierte Konfiguration
 DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
 ENV = os.environ.get('FLASK_ENV', 'production')
@@ -48,8 +63,34 @@ os.makedirs(CUTDOWN_FOLDER, exist_ok=True)
 os.makedirs(TEMP_FOLDER, exist_ok=True)
 os.makedirs(REVOICED_FOLDER, exist_ok=True)
 
-# Speichere den Status der Cutdown-Generierung
-cutdown_status = {}
+# Speichere den Status der Cutdown-Generierung (SQLite auf dem Shared Volume,
+# von allen Gunicorn-Workern gemeinsam genutzt)
+cutdown_status = MetadataStore('cutdown_status')
+
+# Gepoolte Keep-Alive-Clients je Upstream (Timeouts, Retries, Circuit Breaker)
+n8n_client = get_client('n8n')
+musicgen_client = get_client('musicgen')
+elevenlabs_client = get_client('elevenlabs')
+whisper_client = get_client('whisper')
+download_client = get_client('default')
+
+# Wiederaufnehmbare Uploads (Chunks landen direkt im UPLOAD_FOLDER, die Sessions
+# außerhalb von /app/videos, das nginx öffentlich ausliefert)
+UPLOAD_SESSIONS_DIR = os.environ.get('UPLOAD_SESSIONS_DIR', '/app/temp/upload_sessions/frontend')
+upload_store = ResumableUploadStore(UPLOAD_FOLDER, MAX_CONTENT_LENGTH, UPLOAD_SESSIONS_DIR)
+
+# Server-Sent Events: Heartbeat-Intervall und maximale Dauer eines Streams
+# (EventSource verbindet sich danach automatisch neu)
+STATUS_STREAM_HEARTBEAT = 15
+STATUS_STREAM_MAX_SECONDS = 600
+# Jeder offene Stream belegt einen Gunicorn-Thread; darüber hinaus gibt es 503,
+# damit für normale Requests Threads frei bleiben
+STATUS_STREAM_MAX_CLIENTS = int(os.environ.get('STATUS_STREAM_MAX_CLIENTS', '16'))
+_status_stream_slots = threading.BoundedSemaphore(STATUS_STREAM_MAX_CLIENTS)
+
+# Gemeinsames Token für POST /status-events (Analyzer, n8n); die Route ist
+# zusätzlich nur im internen Netz erreichbar (Proxy blockt sie)
+STATUS_EVENTS_TOKEN = os.environ.get('STATUS_EVENTS_TOKEN', '')
 
 class AudioUrlRequest(BaseModel):
     audio_url: str
@@ -106,6 +147,13 @@ def check_status():
                 'error': 'video_id missing in request body'
             }), 400
         
+        # Status, der bereits per /status-events gepusht wurde, braucht keinen n8n-Aufruf
+        pushed_status = status_broker.latest(video_id)
+        if pushed_status is not None:
+            result = jsonify(pushed_status)
+            result.headers['Access-Control-Allow-Origin'] = '*'
+            return result
+        
         webhook_url = f"http://docker-n8n-1:5678/webhook/check-status"
         logger.debug(f"Call n8n webhook: {webhook_url} with video_id: {video_id}")
         
@@ -113,7 +161,7 @@ def check_status():
         for attempt in range(3):  # 3 Versuche
             try:
                 # Die video_id wird jetzt im Body übergeben
-                response = requests.post(webhook_url, json={"video_id": video_id}, timeout=5)
+                response = n8n_client.post(webhook_url, json={"video_id": video_id}, timeout=5)
                 logger.debug(f"n8n response (Attempt {attempt + 1}): Status {response.status_code}")
                 logger.debug(f"n8n response body: {response.text}")
                 
@@ -172,17 +220,21 @@ def proxy_check_status(video_id):
     """Proxy-Route für den n8n Webhook Status-Check"""
     try:
         logger.debug(f"Proxy status check for video {video_id}")
+        pushed_status = status_broker.latest(video_id)
+        if pushed_status is not None:
+            return jsonify(pushed_status)
+        
         webhook_url = f"http://docker-n8n-1:5678/webhook/check-status/{video_id}"
         logger.debug(f"Call n8n webhook: {webhook_url}")
         
-        response = requests.post(webhook_url, json={"video_id": video_id})
+        response = n8n_client.post(webhook_url, json={"video_id": video_id})
         logger.debug(f"n8n response status: {response.status_code}")
         
         if response.status_code == 200:
             status_data = response.json()
             logger.debug(f"Status data: {status_data}")
             # Aktualisiere den lokalen Status-Cache
-            cutdown_status[video_id] = status_data
+            cutdown_status.put(video_id, status_data)
             return jsonify(status_data)
         
         logger.warning(f"Unexpected status code from n8n: {response.status_code}")
@@ -210,17 +262,23 @@ def check_cutdown_status(video_id):
                 'cutdown_path': f"/videos/cutdowns/{video_id}_cut.mp4"
             })
         
+        # Gepushter Status (SSE-Kanal) hat Vorrang vor dem lokalen Cache
+        pushed_status = status_broker.latest(video_id)
+        if pushed_status is not None:
+            return jsonify(pushed_status)
+        
         # Prüfe den Status in der Datenbank
-        if video_id in cutdown_status:
-            return jsonify(cutdown_status[video_id])
+        stored_status = cutdown_status.get(video_id)
+        if stored_status is not None:
+            return jsonify(stored_status)
         
         # Wenn kein Status gefunden wurde, prüfe bei n8n nach
         webhook_url = f"http://docker-n8n-1:5678/webhook/check-status/{video_id}"
-        response = requests.get(webhook_url)
+        response = n8n_client.get(webhook_url)
         
         if response.status_code == 200:
             status_data = response.json()
-            cutdown_status[video_id] = status_data
+            cutdown_status.put(video_id, status_data)
             return jsonify(status_data)
         
         # Wenn n8n nicht antwortet, nehmen wir an, dass es noch verarbeitet wird
@@ -236,6 +294,141 @@ def check_cutdown_status(video_id):
             'error': str(e)
         }), 500
 
+@app.route('/status-events/<video_id>', methods=['POST'])
+def publish_status_event(video_id):
+    """Push a status update (from n8n callbacks or the analyzer) to all subscribers of a video.
+
+    The JSON body is forwarded unchanged; the optional ?event= query parameter sets
+    the SSE event name (default "status", which carries the n8n check-status payload).
+    """
+    if STATUS_EVENTS_TOKEN and not hmac.compare_digest(
+            request.headers.get('X-Status-Token', ''), STATUS_EVENTS_TOKEN):
+        return jsonify({'error': 'Invalid status token'}), 401
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({'error': 'JSON body required'}), 400
+    event = request.args.get('event', 'status')
+    version = status_broker.publish(video_id, payload, event=event)
+    if event == 'status':
+        cutdown_status.put(video_id, payload)
+    return jsonify({'video_id': video_id, 'event': event, 'version': version})
+
+@app.route('/status-stream/<video_id>')
+def status_stream(video_id):
+    """Server-Sent Events stream with the status updates of one video.
+
+    Sends the latest known events right away, then every new one as it is published.
+    The stream ends with an "end" event once a terminal status (completed/failed/100)
+    has been sent; a reconnect after that gets 204, which stops EventSource for good.
+    At most STATUS_STREAM_MAX_CLIENTS streams per worker; beyond that 503 with Retry-After.
+    """
+    try:
+        last_version = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_version = 0
+
+    # Der Client hat den terminalen Status schon bekommen: nichts mehr zu senden
+    for event, event_version, payload in status_broker.events_since(video_id):
+        if event == 'status' and event_version <= last_version and is_terminal_status(payload):
+            return Response(status=204)
+
+    if not _status_stream_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many status streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
+    def generate():
+        version = last_version
+        deadline = time.monotonic() + STATUS_STREAM_MAX_SECONDS
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            events = status_broker.wait(video_id, version, timeout=STATUS_STREAM_HEARTBEAT)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event, event_version, payload in events:
+                version = max(version, event_version)
+                yield f"id: {event_version}\nevent: {event}\ndata: {json.dumps(payload)}\n\n"
+                if event == 'status' and is_terminal_status(payload):
+                    yield "event: end\ndata: {}\n\n"
+                    return
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx darf den Stream nicht puffern
+    # Wird auch aufgerufen, wenn der Client vorher abbricht
+    response.call_on_close(_status_stream_slots.release)
+    return response
+
+DEFAULT_CUTDOWN_OPTIONS = {
+    'length': '60',
+    'style': 'highlight',
+    'focus': ['action']
+}
+
+def _parse_cutdown_options(raw):
+    """Cutdown-Optionen aus dem Formular (JSON-String) oder JSON-Body (dict)"""
+    if isinstance(raw, dict):
+        return dict(raw)
+    if not raw:
+        return dict(DEFAULT_CUTDOWN_OPTIONS)
+    try:
+        cutdown_options = json.loads(raw)
+        logger.debug(f"Cutdown options: {cutdown_options}")
+        return cutdown_options
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse cutdown options: {e}")
+        return dict(DEFAULT_CUTDOWN_OPTIONS)
+
+def _start_cutdown_workflow(video_id, filename, original_filename, file_size, cutdown_options, prompt_text):
+    """Notify n8n about a completely uploaded video and return the upload response"""
+    # Optional prompt (textarea)
+    if prompt_text:
+        cutdown_options['prompt'] = prompt_text
+    
+    # Send webhook notification to n8n
+    webhook_url = "http://docker-n8n-1:5678/webhook/video"
+    webhook_payload = {
+        "filepath": "/app/videos/uploads/" + filename,
+        "filename": filename,
+        "original_filename": original_filename,  # NEW: Original filename for duplicate checking
+        "size": file_size,
+        "video_id": video_id,
+        "id": video_id,
+        "cutdown_options": cutdown_options,
+        "prompt": prompt_text
+    }
+    try:
+        webhook_response = n8n_client.post(webhook_url, json=webhook_payload, headers={"Content-Type": "application/json"}, timeout=5)
+        webhook_response.raise_for_status()
+        logger.info(f"Webhook notification sent successfully: {webhook_response.status_code}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Webhook notification failed (n8n not available): {e}")
+        # n8n is required - return error
+        return jsonify({
+            'error': 'n8n service is not available. Please ensure n8n is running and accessible.',
+            'details': str(e)
+        }), 503
+    
+    # Setze initialen Status
+    cutdown_status.put(video_id, {
+        'status': 'processing',
+        'message': 'Video is being processed'
+    })
+    
+    logger.debug("Webhook sent successfully.")
+    return jsonify({
+        'message': 'File successfully uploaded',
+        'filename': filename,
+        'original_filename': original_filename,  # NEW: Include in response
+        'filepath': "/videos/uploads/" + filename,
+        'status': 'uploaded',
+        'size': file_size,
+        'video_id': video_id,
+        'webhook_status': 'success'
+    }), 200
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
@@ -278,86 +471,10 @@ def upload_file():
         file_size = os.path.getsize(filepath)
         logger.debug(f"File size: {file_size} bytes")
         
-        # Parse cutdown options if provided
-        cutdown_options = {}
-        if 'cutdown_options' in request.form:
-            try:
-                cutdown_options = json.loads(request.form['cutdown_options'])
-                logger.debug(f"Cutdown options: {cutdown_options}")
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse cutdown options: {e}")
-                cutdown_options = {
-                    'length': '60',
-                    'style': 'highlight',
-                    'focus': ['action']
-                }
-        else:
-            # Default options
-            cutdown_options = {
-                'length': '60',
-                'style': 'highlight',
-                'focus': ['action']
-            }
-
-        # Optional prompt (textarea)
+        cutdown_options = _parse_cutdown_options(request.form.get('cutdown_options'))
         prompt_text = (request.form.get('prompt') or '').strip()
-        if prompt_text:
-            cutdown_options['prompt'] = prompt_text
-        
-        # Send webhook notification to n8n
-        webhook_url = "http://docker-n8n-1:5678/webhook/video"
-        webhook_payload = {
-            "filepath": "/app/videos/uploads/" + filename,
-            "filename": filename,
-            "original_filename": original_filename,  # NEW: Original filename for duplicate checking
-            "size": file_size,
-            "video_id": video_id,
-            "id": video_id,
-            "cutdown_options": cutdown_options,
-            "prompt": prompt_text
-        }
-        try:
-            webhook_response = requests.post(webhook_url, json=webhook_payload, headers={"Content-Type": "application/json"}, timeout=5)
-            webhook_response.raise_for_status()
-            logger.info(f"Webhook notification sent successfully: {webhook_response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Webhook notification failed (n8n not available): {e}")
-            # n8n is required - return error
-            return jsonify({
-                'error': 'n8n service is not available. Please ensure n8n is running and accessible.',
-                'details': str(e)
-            }), 503
+        return _start_cutdown_workflow(video_id, filename, original_filename, file_size, cutdown_options, prompt_text)
         
-        # Setze initialen Status
-        cutdown_status[video_id] = {
-            'status': 'processing',
-            'message': 'Video is being processed'
-        }
-        
-        return jsonify({
-                'message': 'File successfully uploaded',
-                'filename': filename,
-                'original_filename': original_filename,  # NEW: Include in response
-                'filepath': "/videos/uploads/" + filename,
-                'status': 'uploaded',
-                'size': file_size,
-                'video_id': video_id,
-                'webhook_status': 'failed',
-                'webhook_error': str(webhook_response.text)
-            }), 200
-        else:
-            logger.debug("Webhook sent successfully.")
-            return jsonify({
-                'message': 'File successfully uploaded',
-                'filename': filename,
-                'original_filename': original_filename,  # NEW: Include in response
-                'filepath': "/videos/uploads/" + filename,
-                'status': 'uploaded',
-                'size': file_size,
-                'video_id': video_id,
-                'webhook_status': 'success'
-            }), 200
-            
     except requests.exceptions.RequestException as e:
         # Only handle errors from the main webhook URL
         if hasattr(e, 'response') and e.response is not None:
@@ -383,6 +500,88 @@ def upload_file():
             'traceback': traceback.format_exc() if app.debug else None
         }), 500
 
+# Resumable Upload: init -> PUT chunks (?offset=) -> GET offset nach Abbruch -> finalize.
+# Der n8n-Webhook wird erst beim finalize ausgelöst.
+
+def _upload_session_response(session):
+    return jsonify({
+        'upload_id': session['upload_id'],
+        'video_id': session['upload_id'],
+        'filename': session['filename'],
+        'offset': session['offset'],
+        'size': session['size'],
+        'chunk_size': session['chunk_size']
+    })
+
+@app.route('/upload/init', methods=['POST'])
+def init_resumable_upload():
+    data = request.get_json(silent=True) or {}
+    raw_filename = data.get('filename') or ''
+    if not raw_filename:
+        return jsonify({'error': 'No file selected'}), 400
+    if not allowed_file(raw_filename):
+        logger.error(f"Invalid file type: {raw_filename}")
+        return jsonify({'error': 'File type not allowed'}), 400
+    try:
+        total_size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'File size required'}), 400
+
+    original_filename = secure_filename(raw_filename)
+    video_id = str(uuid.uuid4())
+    filename = f"{video_id}_{original_filename}"
+    try:
+        session = upload_store.create(video_id, filename, total_size, metadata={
+            'original_filename': original_filename,
+            'cutdown_options': _parse_cutdown_options(data.get('cutdown_options')),
+            'prompt': (data.get('prompt') or '').strip()
+        })
+    except ResumableUploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+    logger.debug(f"Resumable upload started: {filename} ({total_size} bytes)")
+    return _upload_session_response(session), 201
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def get_resumable_upload(upload_id):
+    try:
+        return _upload_session_response(upload_store.status(upload_id))
+    except ResumableUploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    try:
+        offset = int(request.args.get('offset', request.headers.get('Upload-Offset', '')))
+    except ValueError:
+        return jsonify({'error': 'offset required'}), 400
+    try:
+        # request.stream liest den Body direkt vom Socket (kein Werkzeug-Spool)
+        session = upload_store.write_chunk(upload_id, offset, request.stream, request.content_length)
+    except ResumableUploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+    return _upload_session_response(session)
+
+@app.route('/upload/<upload_id>/finalize', methods=['POST'])
+def finalize_resumable_upload(upload_id):
+    try:
+        with upload_store.finalize(upload_id) as session:
+            metadata = session.get('metadata') or {}
+            logger.debug(f"Resumable upload complete: {session['filepath']}")
+            response, status_code = _start_cutdown_workflow(
+                upload_id,
+                session['filename'],
+                metadata.get('original_filename', session['filename']),
+                session['size'],
+                dict(metadata.get('cutdown_options') or DEFAULT_CUTDOWN_OPTIONS),
+                metadata.get('prompt', '')
+            )
+            # Session erst nach erfolgreichem Webhook entfernen, sonst kann finalize wiederholt werden
+            if status_code < 400:
+                upload_store.complete(upload_id)
+            return response, status_code
+    except ResumableUploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+
 @app.route('/videos/uploads/<path:filename>')
 def serve_upload(filename):
     """Serve uploaded video files"""
@@ -432,7 +631,7 @@ def generate_music():
         musicgen_url = "http://musicgen:8001/generate"
         
         # Forward the request
-        response = requests.post(musicgen_url, json=data, timeout=360) # Longer timeout
+        response = musicgen_client.post(musicgen_url, json=data) # Longer timeout (see HTTP_MUSICGEN_TIMEOUT)
         response.raise_for_status() # Raises an error for status codes 4xx/5xx
 
         # Return the response from the musicgen-service to the client
@@ -469,22 +668,37 @@ def serve_generated_music(filename):
     """Serve generated music files"""
     return send_from_directory('/app/music/generated', filename, conditional=True)
 
-@app.post("/detect-language-url")
-async def detect_language_from_url(request: AudioUrlRequest):
-    if not model:
-        raise HTTPException(status_code=503, detail="Whisper model not loaded yet")
+@app.route('/detect-language-url', methods=['POST'])
+def detect_language_from_url():
+    """Sprache einer Audio-/Video-URL über den Whisper-Service erkennen (ohne Transkription)"""
     try:
-        temp_file_path = download_file_from_url(request.audio_url)
-        logger.info(f"Detecting language for URL: {request.audio_url}")
-        result = model.detect_language(temp_file_path)
-        os.unlink(temp_file_path)
-        return {
-            "language": result,
-            "confidence": 1.0
-        }
-    except Exception as e:
+        payload = AudioUrlRequest(**(request.get_json(silent=True) or {}))
+    except ValidationError:
+        return jsonify({'status': 'error', 'message': 'audio_url is required'}), 400
+
+    try:
+        logger.info(f"Detecting language for URL: {payload.audio_url}")
+        response = None
+        media_path = urlparse(payload.audio_url).path
+        if media_path.startswith('/videos/'):
+            # Eigene Medien liegen auf dem gemeinsamen Volume, Whisper liest sie direkt
+            response = whisper_client.post(f"{WHISPER_URL}/detect-language-path", json={'path': media_path})
+        if response is None or response.status_code == 404:
+            # Erst auf Platte spoolen: requests würde einen Stream als multipart-Feld komplett im RAM puffern
+            with tempfile.TemporaryFile() as spool:
+                with download_client.get(payload.audio_url, stream=True) as download:
+                    download.raise_for_status()
+                    for chunk in download.iter_content(chunk_size=1024 * 1024):
+                        spool.write(chunk)
+                spool.seek(0)
+                response = whisper_client.post(
+                    f"{WHISPER_URL}/detect-language",
+                    files={'audio_file': (os.path.basename(media_path) or 'audio', spool)}
+                )
+        return jsonify(response.json()), response.status_code
+    except (requests.exceptions.RequestException, ValueError) as e:
         logger.error(f"Error in detect_language_from_url: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        return jsonify({'status': 'error', 'message': f"Error connecting to whisper service: {e}"}), 502
 
 @app.post("/asr-url")
 async def transcribe_audio_from_url(request: AsrUrlRequest):
@@ -509,7 +723,7 @@ def get_elevenlabs_voices():
             'Content-Type': 'application/json'
         }
         
-        response = requests.get(f'{ELEVENLABS_BASE_URL}/voices', headers=headers)
+        response = elevenlabs_client.get(f'{ELEVENLABS_BASE_URL}/voices', headers=headers)
         
         if response.status_code == 200:
             voices_data = response.json()
@@ -561,7 +775,7 @@ def preview_elevenlabs_voice():
             }
         }
         
-        response = requests.post(
+        response = elevenlabs_client.post(
             f'{ELEVENLABS_BASE_URL}/text-to-speech/{voice_id}',
             headers=headers,
             json=payload
@@ -610,7 +824,7 @@ def generate_elevenlabs_audio():
             }
         }
         
-        response = requests.post(
+        response = elevenlabs_client.post(
             f'{ELEVENLABS_BASE_URL}/text-to-speech/{voice_id}',
             headers=headers,
             json=payload
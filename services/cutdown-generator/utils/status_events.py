@@ -0,0 +1,204 @@
+# utils/status_events.py
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_EVENTS_DIR = os.environ.get('STATUS_EVENTS_DIR', '/app/videos/status')
+# How often a waiting subscriber looks for events published by another Gunicorn worker
+SHARED_CHECK_INTERVAL = 1.0
+# Number of videos whose latest events are kept in memory
+MAX_TRACKED_VIDEOS = 1000
+# Event files of videos without updates for this long are deleted
+STATUS_EVENTS_TTL_HOURS = float(os.environ.get('STATUS_EVENTS_TTL_HOURS', '48'))
+# Minimum time between two sweeps of STATUS_EVENTS_DIR
+SWEEP_INTERVAL = 3600.0
+
+Event = Tuple[str, int, Any]  # (event name, version, payload)
+
+def is_terminal_status(payload: Any) -> bool:
+    """True once a status payload says the processing is finished (done or failed)"""
+    entries = payload if isinstance(payload, list) else [payload]
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        status = entry.get('status')
+        if status in ('completed', 'failed'):
+            return True
+        try:
+            if int(status) >= 100:
+                return True
+        except (TypeError, ValueError):
+            pass
+    return False
+
+class StatusBroker:
+    """Latest status events per video, pushed to subscribers as they are published.
+
+    Publishers (n8n callbacks, the analyzer) call publish(); the SSE endpoint calls
+    wait() and is woken up immediately for events published in the same process.
+    Events are also written to STATUS_EVENTS_DIR on the shared volume, so
+    subscribers served by another worker pick them up with a local file check
+    instead of calling n8n.
+    """
+    def __init__(self, events_dir: str = STATUS_EVENTS_DIR):
+        self.events_dir = events_dir
+        os.makedirs(self.events_dir, exist_ok=True)
+        self._condition = threading.Condition(threading.RLock())
+        # video_id -> {event name: (version, payload)}
+        self._latest: "OrderedDict[str, Dict[str, Tuple[int, Any]]]" = OrderedDict()
+        self._file_mtimes: Dict[str, int] = {}
+        self._last_sweep = 0.0
+
+    def _path(self, video_id: str) -> str:
+        return os.path.join(self.events_dir, f"{os.path.basename(video_id)}.json")
+
+    @contextmanager
+    def _file_lock(self, video_id: str):
+        """Exclusive lock across Gunicorn workers for read-merge-write of a video's event file"""
+        with open(f"{self._path(video_id)}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(self, video_id: str, payload: Any, event: str = 'status') -> int:
+        version = time.time_ns()
+        with self._condition, self._file_lock(video_id):
+            # Merge with what other workers wrote, or their events would be overwritten
+            self._refresh_from_disk(video_id)
+            events = dict(self._latest.get(video_id, {}))
+            events[event] = (version, payload)
+            self._remember(video_id, events)
+            self._write(video_id, events)
+            self._condition.notify_all()
+        self._maybe_sweep()
+        return version
+
+    def _maybe_sweep(self) -> None:
+        """Run sweep() at most once per SWEEP_INTERVAL from the publishing path"""
+        now = time.monotonic()
+        if STATUS_EVENTS_TTL_HOURS <= 0 or now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        try:
+            removed = self.sweep(STATUS_EVENTS_TTL_HOURS * 3600)
+            if removed:
+                logger.info(f"Removed {removed} expired status event files")
+        except OSError as e:
+            logger.warning(f"Status event sweep failed: {e}")
+
+    def sweep(self, max_age: float) -> int:
+        """Delete event files (and their .lock files) not written for max_age seconds"""
+        cutoff = time.time() - max_age
+        removed = 0
+        for name in os.listdir(self.events_dir):
+            if not name.endswith('.json'):
+                continue
+            video_id = name[:-len('.json')]
+            path = self._path(video_id)
+            with self._condition, self._file_lock(video_id):
+                try:
+                    # Re-check under the lock: another worker may just have published
+                    if os.stat(path).st_mtime >= cutoff:
+                        continue
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._latest.pop(video_id, None)
+                self._file_mtimes.pop(video_id, None)
+                try:
+                    os.remove(f"{path}.lock")
+                except OSError:
+                    pass
+                removed += 1
+        # Leftovers of crashed writes and locks whose event file is already gone
+        for name in os.listdir(self.events_dir):
+            if not name.endswith(('.tmp', '.lock')):
+                continue
+            path = os.path.join(self.events_dir, name)
+            if name.endswith('.lock') and os.path.exists(path[:-len('.lock')]):
+                continue
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+        return removed
+
+    def _remember(self, video_id: str, events: Dict[str, Tuple[int, Any]]) -> None:
+        self._latest[video_id] = events
+        self._latest.move_to_end(video_id)
+        while len(self._latest) > MAX_TRACKED_VIDEOS:
+            old_id, _ = self._latest.popitem(last=False)
+            self._file_mtimes.pop(old_id, None)
+
+    def _write(self, video_id: str, events: Dict[str, Tuple[int, Any]]) -> None:
+        path = self._path(video_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({name: [version, payload] for name, (version, payload) in events.items()}, f)
+            os.replace(tmp_path, path)
+            self._file_mtimes[video_id] = os.stat(path).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Could not persist status event for {video_id}: {e}")
+
+    def _refresh_from_disk(self, video_id: str) -> None:
+        """Load events another worker wrote since we last looked (caller holds the lock)"""
+        path = self._path(video_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        if self._file_mtimes.get(video_id) == mtime:
+            return
+        try:
+            with open(path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._file_mtimes[video_id] = mtime
+        events = dict(self._latest.get(video_id, {}))
+        for name, (version, payload) in stored.items():
+            if name not in events or events[name][0] < version:
+                events[name] = (version, payload)
+        self._remember(video_id, events)
+
+    def events_since(self, video_id: str, after_version: int = 0) -> List[Event]:
+        with self._condition:
+            self._refresh_from_disk(video_id)
+            events = self._latest.get(video_id, {})
+            return sorted(
+                ((name, version, payload) for name, (version, payload) in events.items() if version > after_version),
+                key=lambda item: item[1]
+            )
+
+    def latest(self, video_id: str, event: str = 'status') -> Any:
+        for name, _, payload in self.events_since(video_id):
+            if name == event:
+                return payload
+        return None
+
+    def wait(self, video_id: str, after_version: int, timeout: float) -> List[Event]:
+        """Block until events newer than after_version exist or timeout passes"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = self.events_since(video_id, after_version)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._condition.wait(min(remaining, SHARED_CHECK_INTERVAL))
+
+# Singleton instance
+status_broker = StatusBroker()
@@ -11,7 +11,13 @@ import json
 import logging
 from flask import Flask, request, render_template, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
-import requests
+
+# Import shared libraries
+import sys
+sys.path.append('/app/shared')
+from resumable_upload import ResumableUploadStore, ResumableUploadError
+from metadata_store import MetadataStore
+from http_client import get_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -44,7 +50,17 @@ app.config.update(
 for folder in [UPLOAD_FOLDER, CUTDOWNS_FOLDER, SCREENSHOTS_FOLDER, REVOICED_FOLDER, SEPARATED_FOLDER, TEMP_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
-video_sessions = {}
+# Upload sessions, persisted in SQLite on the shared volume (shared by all workers)
+video_sessions = MetadataStore('revoice_sessions')
+
+# Pooled keep-alive clients per upstream (timeouts, retries, circuit breaker)
+n8n_client = get_client('n8n')
+elevenlabs_client = get_client('elevenlabs')
+
+# Resumable uploads (chunks are written straight to UPLOAD_FOLDER, session
+# metadata outside the publicly served /app/videos)
+UPLOAD_SESSIONS_DIR = os.environ.get('UPLOAD_SESSIONS_DIR', '/app/temp/upload_sessions/revoice')
+upload_store = ResumableUploadStore(UPLOAD_FOLDER, MAX_CONTENT_LENGTH, UPLOAD_SESSIONS_DIR)
 
 # ElevenLabs API Configuration
 ELEVENLABS_API_KEY = os.environ.get('ELEVENLABS_API_KEY')
@@ -70,7 +86,7 @@ def health():
         'status': 'healthy',
         'service': 'revoice-upload-service',
         'timestamp': time.time(),
-        'active_sessions': len(video_sessions),
+        'active_sessions': video_sessions.count(),
         'folders': {
             'uploads': os.path.exists(UPLOAD_FOLDER),
             'cutdowns': os.path.exists(CUTDOWNS_FOLDER),
@@ -80,6 +96,54 @@ def health():
         }
     })
 
+def _register_upload(video_id, filename, original_filename, filepath, file_size, require_webhook=False):
+    """Store the session of a completely uploaded video and hand it to N8N.
+
+    Returns (response, webhook_ok). With require_webhook a failed webhook is
+    reported as 503 instead of being logged only.
+    """
+    # Store session data
+    video_sessions.put(video_id, {
+        'video_id': video_id,
+        'original_filename': original_filename,
+        'filename': filename,
+        'filepath': filepath,
+        'file_size': file_size,
+        'upload_time': time.time(),
+        'status': 'uploaded'
+    })
+    
+    # Send to N8N for workflow integration
+    webhook_data = {
+        'video_id': video_id,
+        'filename': filename,
+        'original_filename': original_filename,
+        'filepath': filepath,
+        'size': file_size
+    }
+    
+    try:
+        webhook_response = n8n_client.post(
+            'http://n8n:5678/webhook/lip-sync',
+            json=webhook_data,
+            timeout=10
+        )
+        webhook_response.raise_for_status()
+        logger.info(f"N8N webhook response: {webhook_response.status_code}")
+    except Exception as webhook_error:
+        logger.error(f"N8N webhook error: {webhook_error}")
+        if require_webhook:
+            return (jsonify({'error': 'N8N webhook failed, retry finalize', 'details': str(webhook_error)}), 503), False
+    
+    return jsonify({
+        'success': True,
+        'video_id': video_id,
+        'filename': filename,
+        'original_filename': original_filename,
+        'file_size': file_size,
+        'status': 'processing'
+    }), True
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
@@ -99,45 +163,86 @@ def upload_file():
         file.save(filepath)
         file_size = os.path.getsize(filepath)
         
-        # Store session data
-        video_sessions[video_id] = {
-            'video_id': video_id,
-            'original_filename': original_filename,
-            'filename': filename,
-            'filepath': filepath,
-            'file_size': file_size,
-            'upload_time': time.time(),
-            'status': 'uploaded'
-        }
+        response, _ = _register_upload(video_id, filename, original_filename, filepath, file_size)
+        return response
         
-        # Send to N8N for workflow integration
-        webhook_data = {
-            'video_id': video_id,
-            'filename': filename,
-            'original_filename': original_filename,
-            'filepath': filepath,
-            'size': file_size
-        }
-        
-        try:
-            webhook_response = requests.post(
-                'http://n8n:5678/webhook/lip-sync',
-                json=webhook_data,
-                timeout=10
+    except Exception as e:
+        logger.error(f"Upload error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Resumable upload: init -> PUT chunks (?offset=) -> GET offset after a drop -> finalize.
+# The N8N webhook only fires on finalize.
+
+def _upload_session_response(session):
+    return jsonify({
+        'upload_id': session['upload_id'],
+        'video_id': session['upload_id'],
+        'filename': session['filename'],
+        'offset': session['offset'],
+        'size': session['size'],
+        'chunk_size': session['chunk_size']
+    })
+
+@app.route('/upload/init', methods=['POST'])
+def init_resumable_upload():
+    data = request.get_json(silent=True) or {}
+    raw_filename = data.get('filename') or ''
+    if not raw_filename or not allowed_file(raw_filename):
+        return jsonify({'error': 'Ungültige Datei'}), 400
+    try:
+        total_size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Dateigröße fehlt'}), 400
+    
+    original_filename = secure_filename(raw_filename)
+    video_id = generate_video_id()
+    filename = f"{video_id}_{original_filename}"
+    try:
+        session = upload_store.create(video_id, filename, total_size,
+                                      metadata={'original_filename': original_filename})
+    except ResumableUploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+    return _upload_session_response(session), 201
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def get_resumable_upload(upload_id):
+    try:
+        return _upload_session_response(upload_store.status(upload_id))
+    except ResumableUploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    try:
+        offset = int(request.args.get('offset', request.headers.get('Upload-Offset', '')))
+    except ValueError:
+        return jsonify({'error': 'offset required'}), 400
+    try:
+        # request.stream reads the body from the socket (no Werkzeug temp spool)
+        session = upload_store.write_chunk(upload_id, offset, request.stream, request.content_length)
+    except ResumableUploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+    return _upload_session_response(session)
+
+@app.route('/upload/<upload_id>/finalize', methods=['POST'])
+def finalize_resumable_upload(upload_id):
+    try:
+        with upload_store.finalize(upload_id) as session:
+            metadata = session.get('metadata') or {}
+            response, webhook_ok = _register_upload(
+                upload_id,
+                session['filename'],
+                metadata.get('original_filename', session['filename']),
+                session['filepath'],
+                session['size'],
+                require_webhook=True
             )
-            logger.info(f"N8N webhook response: {webhook_response.status_code}")
-        except Exception as webhook_error:
-            logger.error(f"N8N webhook error: {webhook_error}")
-        
-        return jsonify({
-            'success': True,
-            'video_id': video_id,
-            'filename': filename,
-            'original_filename': original_filename,
-            'file_size': file_size,
-            'status': 'processing'
-        })
-        
+            # Keep the session until N8N has the upload, so finalize can be retried
+            if webhook_ok:
+                upload_store.complete(upload_id)
+            return response
+    except ResumableUploadError as e:
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         logger.error(f"Upload error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -147,7 +252,7 @@ def check_status(video_id):
     """Check video processing status"""
     try:
         # Get session data
-        session_data = video_sessions.get(video_id, {})
+        session_data = video_sessions.get(video_id) or {}
         
         if not session_data:
             return jsonify({'error': 'Video ID not found'}), 404
@@ -168,6 +273,12 @@ def check_status(video_id):
             response['status'] = 'completed'
             response['revoice_available'] = True
             response['download_url'] = f"/videos/revoiced/{revoiced_filename}"
+            # Persist completion (atomic merge), so /sessions?status=completed lists it
+            if session_data.get('status') != 'completed':
+                video_sessions.update(video_id, {
+                    'status': 'completed',
+                    'download_url': response['download_url']
+                })
         else:
             response['status'] = 'processing'
             response['revoice_available'] = False
@@ -196,10 +307,18 @@ def serve_video(folder, filename):
 
 @app.route('/sessions')
 def list_sessions():
-    """List all video sessions"""
+    """List video sessions, newest first (?limit=, ?offset=, ?status=)"""
+    try:
+        limit = int(request.args.get('limit', 50))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    status = request.args.get('status')
     return jsonify({
-        'sessions': list(video_sessions.values()),
-        'total': len(video_sessions)
+        'sessions': video_sessions.list(limit=limit, offset=offset, status=status),
+        'total': video_sessions.count(status=status),
+        'limit': limit,
+        'offset': offset
     })
 
 @app.route('/lip-sync-status', methods=['POST'])
@@ -212,7 +331,7 @@ def lip_sync_status():
     # Anfrage an n8n weiterleiten
     try:
         n8n_url = "http://n8n:5678/webhook/lip-sync-status"
-        n8n_response = requests.post(
+        n8n_response = n8n_client.post(
             n8n_url,
             json={"video_id": video_id},
             headers={"Content-Type": "application/json"},
@@ -231,7 +350,7 @@ def n8n_health():
     test_id = "healthcheck_dummy_id"
     n8n_url = "http://n8n:5678/webhook/lip-sync-status"
     try:
-        resp = requests.post(
+        resp = n8n_client.post(
             n8n_url,
             json={"video_id": test_id},
             headers={"Content-Type": "application/json"},
@@ -253,7 +372,7 @@ def get_elevenlabs_voices():
             'Content-Type': 'application/json'
         }
         
-        response = requests.get(f'{ELEVENLABS_BASE_URL}/voices', headers=headers)
+        response = elevenlabs_client.get(f'{ELEVENLABS_BASE_URL}/voices', headers=headers)
         
         if response.status_code == 200:
             voices_data = response.json()
@@ -305,7 +424,7 @@ def preview_elevenlabs_voice():
             }
         }
         
-        response = requests.post(
+        response = elevenlabs_client.post(
             f'{ELEVENLABS_BASE_URL}/text-to-speech/{voice_id}',
             headers=headers,
             json=payload
@@ -354,7 +473,7 @@ def generate_elevenlabs_audio():
             }
         }
         
-        response = requests.post(
+        response = elevenlabs_client.post(
             f'{ELEVENLABS_BASE_URL}/text-to-speech/{voice_id}',
             headers=headers,
             json=payload
@@ -0,0 +1,62 @@
+import subprocess
+import threading
+from typing import Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+READ_CHUNK_SIZE = 1024 * 1024
+
+def load_audio_range(path: str, start: int, end: Optional[int]) -> np.ndarray:
+    """Decode bytes start..end (inclusive) of a file to 16 kHz mono float32, like load_audio.
+
+    The range is piped into ffmpeg in chunks, so neither a temp file nor the whole
+    range in memory is needed.
+    """
+    cmd = [
+        "ffmpeg", "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "-"
+    ]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def feed():
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = None if end is None else end - start + 1
+                while remaining is None or remaining > 0:
+                    chunk = f.read(READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    process.stdin.write(chunk)
+                    if remaining is not None:
+                        remaining -= len(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    pcm = process.stdout.read()
+    process.wait()
+    feeder.join()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode bytes {start}-{end} of {path}")
+    return np.frombuffer(pcm, np.int16).flatten().astype(np.float32) / 32768.0
+
+def load_audio(path: str, seconds: Optional[float] = None) -> np.ndarray:
+    """Decode a file (or only its first `seconds`) to 16 kHz mono float32"""
+    limit = ["-t", str(seconds)] if seconds else []
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        *limit, "-i", path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "-"
+    ]
+    process = subprocess.run(cmd, capture_output=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {path}: {process.stderr.decode(errors='ignore')[-200:]}")
+    return np.frombuffer(process.stdout, np.int16).flatten().astype(np.float32) / 32768.0
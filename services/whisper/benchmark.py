@@ -0,0 +1,76 @@
+"""Real-time factor (RTF) benchmark for the ASR engines on CPU.
+
+RTF = transcription time / audio duration (lower is better; 0.25 means four
+times faster than real time). Audio is decoded once up front, so only inference
+is measured. Run inside the whisper container, e.g.:
+
+    python benchmark.py /app/videos/separated/example_audio.mp3
+    python benchmark.py audio.mp3 --engines faster_whisper --compute-types int8 float32 --batch-sizes 1 8
+"""
+import argparse
+import itertools
+import os
+import time
+
+from audio import SAMPLE_RATE, load_audio
+from engines import ASR_MODEL, ENGINES, OpenAIWhisperEngine, load_engine
+
+def run_config(audio, engine, model, compute_type, batch_size, threads, runs, language):
+    started = time.perf_counter()
+    instance = load_engine(engine, model_name=model, device="cpu", compute_type=compute_type,
+                           batch_size=batch_size, cpu_threads=threads)
+    load_seconds = time.perf_counter() - started
+
+    # Warm-up on the first 30 seconds (allocations, lazy initialisation)
+    instance.transcribe(audio[:30 * SAMPLE_RATE], language=language)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = instance.transcribe(audio, language=language)
+        timings.append(time.perf_counter() - started)
+    return load_seconds, min(timings), len(result["segments"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the real-time factor of the ASR engines")
+    parser.add_argument("audio", help="Audio or video file")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--model", default=ASR_MODEL)
+    parser.add_argument("--compute-types", nargs="+", default=["int8"],
+                        help="faster_whisper compute types (openai_whisper always runs float32 on CPU)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1],
+                        help="faster_whisper batch sizes")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--runs", type=int, default=2, help="Timed runs per configuration (best is reported)")
+    parser.add_argument("--language", default=None, help="Skip language detection, e.g. de")
+    args = parser.parse_args()
+
+    try:
+        import torch
+        torch.set_num_threads(args.threads)
+    except ImportError:
+        pass
+
+    audio = load_audio(args.audio)
+    duration = len(audio) / SAMPLE_RATE
+    print(f"{args.audio}: {duration:.1f} s audio, model {args.model}, {args.threads} threads\n")
+
+    configs = []
+    for engine in args.engines:
+        if engine == OpenAIWhisperEngine.name:
+            configs.append((engine, "float32", 1))
+        else:
+            configs += [(engine, compute_type, batch_size)
+                        for compute_type, batch_size in itertools.product(args.compute_types, args.batch_sizes)]
+
+    print(f"{'engine':<16}{'compute':<10}{'batch':>6}{'load s':>9}{'infer s':>10}{'RTF':>8}{'speedup':>9}{'segments':>10}")
+    baseline = None
+    for engine, compute_type, batch_size in configs:
+        load_seconds, seconds, segments = run_config(audio, engine, args.model, compute_type, batch_size,
+                                                     args.threads, args.runs, args.language)
+        rtf = seconds / duration
+        baseline = baseline or rtf
+        print(f"{engine:<16}{compute_type:<10}{batch_size:>6}{load_seconds:>9.1f}{seconds:>10.1f}"
+              f"{rtf:>8.3f}{baseline / rtf:>8.1f}x{segments:>10}")
+
+if __name__ == "__main__":
+    main()
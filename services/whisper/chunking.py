@@ -0,0 +1,73 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+# Target chunk length for chunked transcription; cuts are placed in the quietest
+# spot of the last CHUNK_SEARCH_SECONDS before each target boundary
+CHUNK_SECONDS = float(os.environ.get("ASR_CHUNK_SECONDS", "60"))
+CHUNK_SEARCH_SECONDS = float(os.environ.get("ASR_CHUNK_SEARCH_SECONDS", "15"))
+# Shorter chunks for streaming, so the first segments arrive early
+STREAM_CHUNK_SECONDS = float(os.environ.get("ASR_STREAM_CHUNK_SECONDS", "30"))
+# Energy frames used to find silences
+FRAME_SECONDS = 0.03
+
+def _frame_energy(audio: np.ndarray, frame: int) -> np.ndarray:
+    usable = len(audio) - len(audio) % frame
+    frames = audio[:usable].reshape(-1, frame)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+def split_on_silence(audio: np.ndarray, chunk_seconds: float = CHUNK_SECONDS,
+                     search_seconds: float = CHUNK_SEARCH_SECONDS) -> List[Tuple[int, int]]:
+    """Split 16 kHz audio into (start, end) sample ranges of about chunk_seconds.
+
+    Simple energy VAD: every cut goes to the lowest-energy stretch (a pause between
+    words or sentences) within search_seconds before the target boundary, so no
+    word is cut in half. Audio shorter than two chunks stays in one piece (the
+    last chunk may be up to twice chunk_seconds long).
+    """
+    total = len(audio)
+    chunk = int(chunk_seconds * SAMPLE_RATE)
+    if chunk <= 0 or total < 2 * chunk:
+        return [(0, total)]
+
+    frame = int(FRAME_SECONDS * SAMPLE_RATE)
+    # Smooth over ~0.3 s so a cut lands in a pause rather than a single quiet frame
+    energy = np.convolve(_frame_energy(audio, frame), np.ones(10) / 10, mode="same")
+    search = max(1, int(search_seconds / FRAME_SECONDS))
+
+    ranges = []
+    start = 0
+    while total - start >= 2 * chunk:
+        target = (start + chunk) // frame
+        low = max(target - search, start // frame + 1)
+        cut = (low + int(np.argmin(energy[low:target + 1]))) * frame
+        ranges.append((start, cut))
+        start = cut
+    ranges.append((start, total))
+    return ranges
+
+def shift_segments(segments: List[Dict[str, Any]], offset: float, first_id: int = 0) -> List[Dict[str, Any]]:
+    """Segments of one chunk moved by offset seconds and numbered from first_id"""
+    shifted = []
+    for segment in segments:
+        moved = {**segment, "id": first_id + len(shifted),
+                 "start": segment["start"] + offset, "end": segment["end"] + offset}
+        if "words" in segment:
+            moved["words"] = [{**word, "start": word["start"] + offset, "end": word["end"] + offset}
+                              for word in segment["words"]]
+        shifted.append(moved)
+    return shifted
+
+def merge_results(results: List[Dict[str, Any]], ranges: List[Tuple[int, int]]) -> Dict[str, Any]:
+    """Combine per-chunk Whisper results into one, shifting timestamps by the chunk offsets"""
+    segments = []
+    for result, (start, _) in zip(results, ranges):
+        segments += shift_segments(result.get("segments", []), start / SAMPLE_RATE, len(segments))
+    return {
+        "text": "".join(result["text"] for result in results),
+        "language": results[0].get("language", "unknown") if results else "unknown",
+        "segments": segments
+    }
@@ -0,0 +1,119 @@
+import logging
+import os
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Engine selection, read once at startup (see docker-compose.yml)
+ASR_ENGINE = os.environ.get("ASR_ENGINE", "openai_whisper")
+ASR_MODEL = os.environ.get("ASR_MODEL", "base")
+ASR_DEVICE = os.environ.get("ASR_DEVICE", "cpu")
+# Model files are downloaded once and then loaded from here (a persistent volume)
+ASR_DOWNLOAD_ROOT = os.environ.get("ASR_DOWNLOAD_ROOT", "/app/asr_models")
+# faster_whisper only: int8, int8_float32, float16, float32, ...
+ASR_COMPUTE_TYPE = os.environ.get("ASR_COMPUTE_TYPE", "int8")
+# faster_whisper only: >1 decodes that many 30 s windows of a file in one batch
+ASR_BATCH_SIZE = max(1, int(os.environ.get("ASR_BATCH_SIZE", "1")))
+
+Audio = Union[str, np.ndarray]
+
+class OpenAIWhisperEngine:
+    """Reference PyTorch implementation (openai-whisper), fp32 on CPU and fp16 on GPU"""
+    name = "openai_whisper"
+
+    def __init__(self, model_name: str = ASR_MODEL, device: str = ASR_DEVICE,
+                 download_root: str = ASR_DOWNLOAD_ROOT, **_: Any):
+        import whisper
+
+        self._whisper = whisper
+        self.model_name = model_name
+        self.compute_type = "float16" if device.startswith("cuda") else "float32"
+        # Loads the serialized checkpoint from download_root, downloading it only the first time
+        self.model = whisper.load_model(model_name, device=device, download_root=download_root)
+
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict[str, Any]:
+        return self.model.transcribe(audio, language=language, fp16=self.compute_type == "float16")
+
+    def language_probabilities(self, audio: np.ndarray) -> Dict[str, float]:
+        whisper = self._whisper
+        # large-v3 uses 128 mel bins instead of 80
+        mel = whisper.log_mel_spectrogram(
+            whisper.pad_or_trim(audio), n_mels=self.model.dims.n_mels
+        ).to(self.model.device)
+        _, probs = self.model.detect_language(mel)
+        return probs
+
+class FasterWhisperEngine:
+    """CTranslate2 implementation (faster-whisper) with int8 quantization and batched decoding"""
+    name = "faster_whisper"
+
+    def __init__(self, model_name: str = ASR_MODEL, device: str = ASR_DEVICE,
+                 compute_type: str = ASR_COMPUTE_TYPE, batch_size: int = ASR_BATCH_SIZE,
+                 cpu_threads: int = 0, download_root: str = ASR_DOWNLOAD_ROOT):
+        from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.batch_size = batch_size
+        options = dict(device=device, compute_type=compute_type, cpu_threads=cpu_threads,
+                       download_root=download_root)
+        try:
+            # Converted CTranslate2 model already on disk: no Hugging Face round trip
+            self.model = WhisperModel(model_name, local_files_only=True, **options)
+        except Exception:
+            self.model = WhisperModel(model_name, **options)
+        self.pipeline = BatchedInferencePipeline(model=self.model) if batch_size > 1 else None
+
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict[str, Any]:
+        if self.pipeline is not None:
+            segments, info = self.pipeline.transcribe(audio, language=language, batch_size=self.batch_size)
+        else:
+            segments, info = self.model.transcribe(audio, language=language)
+        # Same shape as openai-whisper results (segments are decoded lazily while iterating)
+        converted = [
+            {
+                "id": index,
+                "seek": segment.seek,
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text,
+                "tokens": list(segment.tokens),
+                "temperature": segment.temperature,
+                "avg_logprob": segment.avg_logprob,
+                "compression_ratio": segment.compression_ratio,
+                "no_speech_prob": segment.no_speech_prob
+            }
+            for index, segment in enumerate(segments)
+        ]
+        return {
+            "text": "".join(segment["text"] for segment in converted),
+            "language": info.language,
+            "segments": converted
+        }
+
+    def language_probabilities(self, audio: np.ndarray) -> Dict[str, float]:
+        _, _, probabilities = self.model.detect_language(audio)
+        return dict(probabilities)
+
+ENGINES = {
+    OpenAIWhisperEngine.name: OpenAIWhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+}
+
+def load_engine(engine: str = ASR_ENGINE, **options: Any):
+    """Instantiate the configured engine (one replica; every scheduler worker loads its own)"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown ASR_ENGINE '{engine}', expected one of {', '.join(ENGINES)}")
+    if engine == OpenAIWhisperEngine.name and ASR_COMPUTE_TYPE not in ("float32", "float16"):
+        logger.info(f"ASR_COMPUTE_TYPE={ASR_COMPUTE_TYPE} only applies to faster_whisper; using {engine} as is")
+    return ENGINES[engine](**options)
+
+def engine_id() -> str:
+    """Identifies the transcription setup (part of transcript cache keys)"""
+    if ASR_ENGINE == FasterWhisperEngine.name:
+        # Batched decoding (VAD-split segments) yields different output than the sequential pipeline
+        pipeline = f"batched{ASR_BATCH_SIZE}" if ASR_BATCH_SIZE > 1 else "sequential"
+        return f"{ASR_ENGINE}:{ASR_MODEL}:{ASR_COMPUTE_TYPE}:{pipeline}"
+    return f"{ASR_ENGINE}:{ASR_MODEL}"
@@ -1,49 +1,343 @@
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-import whisper
+from fastapi import FastAPI, UploadFile, File, Form, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from typing import Optional, Tuple
+import asyncio
+import json
+import numpy as np
 import os
 import tempfile
+from scheduler import InferenceScheduler, QueueFullError, ClientDisconnectedError
+from chunking import split_on_silence, merge_results, shift_segments, CHUNK_SECONDS, STREAM_CHUNK_SECONDS
+from transcript_cache import transcript_cache, copy_and_hash, hash_file
+from engines import load_engine, engine_id
+from audio import SAMPLE_RATE, load_audio, load_audio_range
 
 app = FastAPI()
 
-# Load Whisper model
-model = whisper.load_model("base")
+def _load_replica():
+    """One replica of the configured engine (ASR_ENGINE) with an equal share of the CPU threads"""
+    engine = load_engine(cpu_threads=max(1, (os.cpu_count() or 1) // scheduler.workers))
+    # A short inference initialises kernels and buffers before the first real request
+    engine.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), language="en")
+    return engine
+
+# Every scheduler worker loads its own replica in the background; the port is bound
+# right away and requests arriving during warm-up wait in the queue
+scheduler = InferenceScheduler(_load_replica)
+
+@app.on_event("startup")
+async def start_scheduler():
+    scheduler.start()
+
+# Shared media volume; /asr-path only reads files below this directory
+MEDIA_ROOT = os.path.realpath(os.environ.get("WHISPER_MEDIA_ROOT", "/app/videos"))
+# Language detection only decodes this much audio from the start of the file
+DETECT_SECONDS = float(os.environ.get("ASR_DETECT_SECONDS", "30"))
+# Streaming output formats (stream=...) and their content types
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+class PathTranscribeRequest(BaseModel):
+    path: str
+    language_code: Optional[str] = None
+    # Optional inclusive byte range of the file (e.g. a slice of an MP3/ADTS stream)
+    byte_start: Optional[int] = None
+    byte_end: Optional[int] = None
+    # Split at silences and transcribe the parts in parallel
+    chunked: bool = False
+    # "ndjson" or "sse": stream segments as they are decoded
+    stream: Optional[str] = None
+
+class PathLanguageRequest(BaseModel):
+    path: str
+
+def _format_result(result):
+    return {
+        "text": result["text"],
+        "language": result.get("language", "unknown"),
+        "segments": result.get("segments", [])
+    }
+
+def _resolve_media_path(path: str) -> Optional[str]:
+    """Absolute path of an existing file on the media volume, or None"""
+    if path.startswith("/videos/"):
+        path = "/app" + path
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([real_path, MEDIA_ROOT]) != MEDIA_ROOT or not os.path.isfile(real_path):
+        return None
+    return real_path
+
+def _decode_audio(file_path: str, byte_range: Optional[Tuple[int, Optional[int]]] = None) -> np.ndarray:
+    if byte_range is None:
+        return load_audio(file_path)
+    return load_audio_range(file_path, *byte_range)
+
+def _detect_language(model, audio: np.ndarray) -> str:
+    """Most likely language of the first 30 seconds"""
+    probs = model.language_probabilities(audio)
+    return max(probs, key=probs.get)
+
+async def _identify_language(request: Request, file_path: str) -> dict:
+    """Language of a file from its first DETECT_SECONDS, without transcribing it"""
+    audio = await asyncio.to_thread(load_audio, file_path, DETECT_SECONDS)
+    # Both engines look at a single 30 s mel segment
+    probs = await scheduler.run(lambda model: model.language_probabilities(audio), request.is_disconnected)
+    top = sorted(probs.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        "language": top[0][0],
+        "confidence": round(float(top[0][1]), 4),
+        "probabilities": {language: round(float(p), 4) for language, p in top}
+    }
+
+async def _transcribe(request: Request, file_path: str, language: Optional[str] = None,
+                      chunked: bool = False, byte_range: Optional[Tuple[int, Optional[int]]] = None):
+    """Transcribe a file on the scheduler workers.
+
+    Chunked mode splits the audio at silences and transcribes the chunks in
+    parallel (one per worker); the language is detected once up front so all
+    chunks decode the same language.
+    """
+    if not chunked:
+        def job(model):
+            # Decoding happens on the worker too, so the event loop stays free
+            audio = file_path if byte_range is None else load_audio_range(file_path, *byte_range)
+            return model.transcribe(audio, language=language)
+        return await scheduler.run(job, request.is_disconnected)
+
+    audio = await asyncio.to_thread(_decode_audio, file_path, byte_range)
+    ranges = split_on_silence(audio)
+    if language is None and len(ranges) > 1:
+        language = await scheduler.run(lambda model: _detect_language(model, audio), request.is_disconnected)
+    jobs = [
+        lambda model, chunk=audio[start:end]: model.transcribe(chunk, language=language)
+        for start, end in ranges
+    ]
+    results = await scheduler.run_many(jobs, request.is_disconnected)
+    return merge_results(results, ranges)
+
+def _stream_event(stream_format: str, event: str, data: dict) -> str:
+    data = jsonable_encoder(data)
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"type": event, **data}) + "\n"
+
+def _stream_response(stream_format: str, events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _cached_events(stream_format: str, result: dict):
+    """A cached transcript replayed as stream events"""
+    yield _stream_event(stream_format, "language", {"language": result["language"]})
+    for segment in result["segments"]:
+        yield _stream_event(stream_format, "segment", segment)
+    yield _stream_event(stream_format, "done", {"text": result["text"], "language": result["language"],
+                                                "segments": len(result["segments"])})
+
+async def _transcribe_stream(request: Request, file_path: str, language: Optional[str], stream_format: str,
+                             byte_range: Optional[Tuple[int, Optional[int]]] = None,
+                             cache_key: Optional[str] = None) -> StreamingResponse:
+    """Transcription whose segments are streamed as soon as their chunk is decoded.
+
+    Events: one `language`, then a `segment` per segment (timestamps relative to
+    the whole file), finally `done` with the full text, or `error`. The audio is
+    decoded, the language detected and the chunks queued before the response
+    starts, so a full queue still answers 429 and the file may be removed afterwards.
+    """
+    audio = await asyncio.to_thread(_decode_audio, file_path, byte_range)
+    ranges = split_on_silence(audio, STREAM_CHUNK_SECONDS)
+    if language is None:
+        language = await scheduler.run(lambda model: _detect_language(model, audio), request.is_disconnected)
+    jobs = scheduler.submit([
+        lambda model, chunk=audio[start:end]: model.transcribe(chunk, language=language)
+        for start, end in ranges
+    ])
+
+    async def events():
+        texts = []
+        segments = []
+        try:
+            yield _stream_event(stream_format, "language", {"language": language})
+            chunk_index = 0
+            async for result in scheduler.iter_results(jobs, request.is_disconnected):
+                offset = ranges[chunk_index][0] / SAMPLE_RATE
+                chunk_index += 1
+                for segment in shift_segments(result.get("segments", []), offset, len(segments)):
+                    segment = jsonable_encoder(segment)
+                    yield _stream_event(stream_format, "segment", segment)
+                    segments.append(segment)
+                texts.append(result["text"])
+            text = "".join(texts)
+            if cache_key is not None:
+                await asyncio.to_thread(transcript_cache.put, cache_key,
+                                        {"text": text, "language": language, "segments": segments})
+            yield _stream_event(stream_format, "done",
+                                {"text": text, "language": language, "segments": len(segments)})
+        except ClientDisconnectedError:
+            return
+        except Exception as e:
+            yield _stream_event(stream_format, "error", {"error": str(e)})
+
+    return _stream_response(stream_format, events())
+
+async def _respond(request: Request, file_path: str, audio_hash: str, language: Optional[str],
+                   chunked: bool = False, stream: Optional[str] = None,
+                   byte_range: Optional[Tuple[int, Optional[int]]] = None):
+    """Transcript from the cache or freshly transcribed, as JSON or as a stream.
+
+    Cache entries are keyed by the audio content hash, the model, the requested
+    language and the chunking (which slightly changes segment boundaries).
+    """
+    chunk_seconds = STREAM_CHUNK_SECONDS if stream else (CHUNK_SECONDS if chunked else 0)
+    cache_key = transcript_cache.make_key(audio_hash, model=engine_id(), language=language or "auto",
+                                          chunk_seconds=chunk_seconds)
+    cached = await asyncio.to_thread(transcript_cache.get, cache_key)
+    if stream:
+        if cached is not None:
+            return _stream_response(stream, _cached_events(stream, cached))
+        return await _transcribe_stream(request, file_path, language, stream, byte_range, cache_key)
+    if cached is not None:
+        return cached
+
+    result = jsonable_encoder(_format_result(await _transcribe(request, file_path, language, chunked, byte_range)))
+    await asyncio.to_thread(transcript_cache.put, cache_key, result)
+    return result
+
+def _save_upload(audio_file: UploadFile) -> Tuple[str, str]:
+    """Copy an upload (already spooled by Starlette) to a temp file piece by piece.
+
+    Memory stays bounded whatever the upload size; returns (path, SHA-256 of the content).
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
+        try:
+            audio_file.file.seek(0)
+            audio_hash = copy_and_hash(audio_file.file, tmp_file)
+        except BaseException:
+            os.unlink(tmp_file.name)
+            raise
+    return tmp_file.name, audio_hash
+
+def _error_response(e: Exception) -> JSONResponse:
+    if isinstance(e, QueueFullError):
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e), "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if isinstance(e, ClientDisconnectedError):
+        # Nobody is listening anymore; 499 only shows up in the logs
+        return JSONResponse(status_code=499, content={"error": "Client disconnected"})
+    return JSONResponse(
+        status_code=500,
+        content={"error": str(e)}
+    )
 
 @app.post("/asr")
-async def transcribe_audio(audio_file: UploadFile = File(...), language_code: str = Form(None)):
+async def transcribe_audio(request: Request, audio_file: UploadFile = File(...), language_code: str = Form(None),
+                           chunked: bool = Form(False), stream: str = Form(None)):
     """
-    Transcribe audio file using Whisper
+    Transcribe audio file using Whisper.
+    chunked=true splits long audio at silences and transcribes the parts in parallel;
+    stream=ndjson|sse returns the segments as they are decoded.
     """
+    if stream and stream not in STREAM_MEDIA_TYPES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown stream format: {stream}"})
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-            content = await audio_file.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-        
+        # Save uploaded file temporarily (in pieces, off the event loop)
+        tmp_file_path, audio_hash = await asyncio.to_thread(_save_upload, audio_file)
+
         try:
-            # Transcribe with Whisper
-            if language_code:
-                result = model.transcribe(tmp_file_path, language=language_code)
-            else:
-                result = model.transcribe(tmp_file_path)
-            
-            return {
-                "text": result["text"],
-                "language": result.get("language", "unknown"),
-                "segments": result.get("segments", [])
-            }
+            # Transcribe with Whisper; a stream decodes the audio before it returns, so the file can go
+            return await _respond(request, tmp_file_path, audio_hash, language_code or None,
+                                  chunked, stream)
         finally:
             # Clean up temporary file
             if os.path.exists(tmp_file_path):
                 os.unlink(tmp_file_path)
-                
+
+    except Exception as e:
+        return _error_response(e)
+
+@app.post("/asr-path")
+async def transcribe_audio_path(body: PathTranscribeRequest, request: Request):
+    """
+    Transcribe a file from the shared media volume by path (no upload, no temp copy).
+    With byte_start/byte_end only that byte range of the file is decoded; chunked and
+    stream work as for /asr.
+    """
+    file_path = _resolve_media_path(body.path)
+    if file_path is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"File not found on media volume: {body.path}"}
+        )
+    if (body.byte_start is not None and body.byte_start < 0) or (
+            body.byte_end is not None and body.byte_end < (body.byte_start or 0)):
+        return JSONResponse(status_code=400, content={"error": "Invalid byte range"})
+    if body.stream and body.stream not in STREAM_MEDIA_TYPES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown stream format: {body.stream}"})
+
+    byte_range = None
+    if body.byte_start is not None or body.byte_end is not None:
+        byte_range = (body.byte_start or 0, body.byte_end)
+    try:
+        audio_hash = await asyncio.to_thread(hash_file, file_path, byte_range)
+        return await _respond(request, file_path, audio_hash, body.language_code or None,
+                              body.chunked, body.stream, byte_range)
+    except Exception as e:
+        return _error_response(e)
+
+@app.post("/detect-language")
+async def detect_language(request: Request, audio_file: UploadFile = File(...)):
+    """
+    Detect the spoken language from the first seconds of an audio file (no transcription)
+    """
+    try:
+        tmp_file_path, _ = await asyncio.to_thread(_save_upload, audio_file)
+        try:
+            return await _identify_language(request, tmp_file_path)
+        finally:
+            if os.path.exists(tmp_file_path):
+                os.unlink(tmp_file_path)
     except Exception as e:
+        return _error_response(e)
+
+@app.post("/detect-language-path")
+async def detect_language_path(body: PathLanguageRequest, request: Request):
+    """
+    Detect the spoken language of a file on the shared media volume
+    """
+    file_path = _resolve_media_path(body.path)
+    if file_path is None:
         return JSONResponse(
-            status_code=500,
-            content={"error": str(e)}
+            status_code=404,
+            content={"error": f"File not found on media volume: {body.path}"}
         )
+    try:
+        return await _identify_language(request, file_path)
+    except Exception as e:
+        return _error_response(e)
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once a model replica is loaded, 503 while warming up (liveness is /health)"""
+    if scheduler.ready:
+        return {"status": "ready", "engine": engine_id(), "scheduler": scheduler.stats()}
+    status = "failed" if scheduler.failed else "warming_up"
+    return JSONResponse(
+        status_code=503,
+        content={"status": status, "error": scheduler.load_error, "scheduler": scheduler.stats()}
+    )
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy", "engine": engine_id(), "scheduler": scheduler.stats(),
+            "cache": transcript_cache.stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Transcript cache hit/miss counters (since the service started)"""
+    return transcript_cache.stats()
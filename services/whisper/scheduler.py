@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Worker threads, each with its own model replica
+ASR_WORKERS = max(1, int(os.environ.get("ASR_WORKERS", "1")))
+# Requests allowed to wait for a worker before new ones get 429
+ASR_QUEUE_SIZE = max(0, int(os.environ.get("ASR_QUEUE_SIZE", "8")))
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+
+class QueueFullError(Exception):
+    """The scheduler queue is full; retry_after is a rough wait estimate in seconds"""
+    def __init__(self, retry_after: int):
+        super().__init__("Transcription queue is full")
+        self.retry_after = retry_after
+
+class ClientDisconnectedError(Exception):
+    """The client went away before its transcription started"""
+
+class InferenceJob:
+    def __init__(self, func: Callable[[Any], Any], loop: asyncio.AbstractEventLoop):
+        self.func = func
+        self.loop = loop
+        self.future: asyncio.Future = loop.create_future()
+        self.cancelled = threading.Event()
+
+    def _resolve(self, result: Any = None, error: Optional[BaseException] = None) -> None:
+        if self.future.done():
+            return
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+    def finish(self, result: Any = None, error: Optional[BaseException] = None) -> None:
+        self.loop.call_soon_threadsafe(self._resolve, result, error)
+
+class InferenceScheduler:
+    """Bounded request queue in front of a pool of worker threads.
+
+    Every worker loads its own model replica via model_factory in the background
+    (requests submitted meanwhile wait in the queue) and runs one job at a time,
+    so transcriptions never block the event loop (health checks stay responsive)
+    and up to `workers` of them run in parallel. PyTorch releases the
+    GIL inside its kernels, so threads scale across cores; the intra-op thread
+    pool is split between the replicas.
+    """
+    def __init__(self, model_factory: Callable[[], Any], workers: int = ASR_WORKERS,
+                 max_queue: int = ASR_QUEUE_SIZE):
+        self.model_factory = model_factory
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue: "queue.Queue[InferenceJob]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._durations: List[float] = []
+        self._threads: List[threading.Thread] = []
+        # Replicas are loaded one after another, so the first one serves as early as possible
+        self._load_lock = threading.Lock()
+        self._ready_workers = 0
+        self._failed_workers = 0
+        self.load_error: Optional[str] = None
+
+    def start(self) -> None:
+        try:
+            import torch
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.workers))
+        except ImportError:
+            pass
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, args=(index,), name=f"asr-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self, index: int) -> None:
+        started = time.monotonic()
+        try:
+            with self._load_lock:
+                model = self.model_factory()
+        except Exception as e:
+            logger.exception(f"ASR worker {index} could not load its model")
+            with self._lock:
+                self.load_error = str(e)
+                self._failed_workers += 1
+            if self.failed:
+                self._fail_queued()
+            return
+        with self._lock:
+            self._ready_workers += 1
+        logger.info(f"ASR worker {index} ready after {time.monotonic() - started:.1f}s")
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._queued -= 1
+                if job.cancelled.is_set():
+                    continue
+                self._running += 1
+            started = time.monotonic()
+            try:
+                job.finish(job.func(model))
+            except BaseException as e:
+                job.finish(error=e)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._durations = (self._durations + [time.monotonic() - started])[-20:]
+
+    def _retry_after(self) -> int:
+        average = sum(self._durations) / len(self._durations) if self._durations else 30.0
+        return max(1, math.ceil(average * (self._queued + 1) / self.workers))
+
+    def _fail_queued(self) -> None:
+        """No replica could be loaded: fail everything that is waiting"""
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._queued -= 1
+            job.finish(error=RuntimeError(f"ASR model could not be loaded: {self.load_error}"))
+
+    @property
+    def failed(self) -> bool:
+        return self._failed_workers >= self.workers
+
+    @property
+    def ready(self) -> bool:
+        """At least one replica is loaded (requests queue up until then)"""
+        return self._ready_workers > 0
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "ready_workers": self._ready_workers, "running": self._running,
+                "queued": self._queued, "max_queue": self.max_queue}
+
+    async def run(self, func: Callable[[Any], Any], is_disconnected: Optional[Callable[[], Any]] = None) -> Any:
+        """Run func(model) on a worker and return its result.
+
+        Raises QueueFullError when max_queue requests are already waiting, and
+        ClientDisconnectedError when is_disconnected() reports the client gone
+        while the job is still queued (the job is then dropped). A job that has
+        already started runs to completion; its result is discarded.
+        """
+        return (await self.run_many([func], is_disconnected))[0]
+
+    def submit(self, funcs: List[Callable[[Any], Any]]) -> List[InferenceJob]:
+        """Queue the jobs of one request.
+
+        The request is admitted as a whole (it counts against max_queue once);
+        raises QueueFullError when the queue is full.
+        """
+        if self.failed:
+            raise RuntimeError(f"ASR model could not be loaded: {self.load_error}")
+        with self._lock:
+            if self._queued >= self.max_queue + max(0, self.workers - self._running):
+                raise QueueFullError(self._retry_after())
+            self._queued += len(funcs)
+        loop = asyncio.get_running_loop()
+        jobs = [InferenceJob(func, loop) for func in funcs]
+        for job in jobs:
+            self._queue.put(job)
+        return jobs
+
+    @staticmethod
+    def cancel(jobs: List[InferenceJob]) -> None:
+        """Drop jobs that have not started yet"""
+        for job in jobs:
+            job.cancelled.set()
+
+    async def run_many(self, funcs: List[Callable[[Any], Any]],
+                       is_disconnected: Optional[Callable[[], Any]] = None) -> List[Any]:
+        """Run several jobs of one request in parallel across the workers.
+
+        All queued jobs are dropped when the client disconnects or one job fails.
+        """
+        jobs = self.submit(funcs)
+        pending = {job.future for job in jobs}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=DISCONNECT_POLL_SECONDS,
+                                                   return_when=asyncio.FIRST_EXCEPTION)
+                for future in done:
+                    # Raises the exception of a failed job
+                    future.result()
+                if pending and is_disconnected is not None and await is_disconnected():
+                    raise ClientDisconnectedError()
+        except BaseException:
+            self.cancel(jobs)
+            raise
+        return [job.future.result() for job in jobs]
+
+    async def iter_results(self, jobs: List[InferenceJob],
+                           is_disconnected: Optional[Callable[[], Any]] = None) -> AsyncIterator[Any]:
+        """Yield the results of submitted jobs in order, each as soon as it is ready.
+
+        Stopping early (client gone, failed job, generator closed) drops the jobs
+        that have not started yet.
+        """
+        try:
+            for job in jobs:
+                while True:
+                    done, _ = await asyncio.wait({job.future}, timeout=DISCONNECT_POLL_SECONDS)
+                    if done:
+                        break
+                    if is_disconnected is not None and await is_disconnected():
+                        raise ClientDisconnectedError()
+                yield job.future.result()
+        finally:
+            self.cancel(jobs)
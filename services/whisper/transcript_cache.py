@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, BinaryIO, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ASR_CACHE_DIR = os.environ.get("ASR_CACHE_DIR", "/app/cache/transcripts")
+ASR_CACHE_MAX_MB = int(os.environ.get("ASR_CACHE_MAX_MB", "512"))
+ASR_CACHE_ENABLED = os.environ.get("ASR_CACHE_ENABLED", "true").lower() == "true"
+
+# Bump when the cached result format changes
+CACHE_FORMAT_VERSION = 1
+HASH_BUFFER_SIZE = 1024 * 1024
+# Content hashes by (path, size, mtime, range), so a file is only read once while unchanged
+# (least recently used first; requests hash in to_thread workers, hence the lock)
+_file_hashes: "OrderedDict[tuple, str]" = OrderedDict()
+_file_hashes_lock = threading.Lock()
+MAX_REMEMBERED_HASHES = 1024
+
+def copy_and_hash(src: BinaryIO, dst: BinaryIO) -> str:
+    """Copy a file object in HASH_BUFFER_SIZE pieces and return the SHA-256 of the copied bytes"""
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: src.read(HASH_BUFFER_SIZE), b""):
+        sha.update(chunk)
+        dst.write(chunk)
+    return sha.hexdigest()
+
+def hash_file(path: str, byte_range: Optional[Tuple[int, Optional[int]]] = None) -> str:
+    """SHA-256 of a file, or of the inclusive byte range (start, end) of it"""
+    stat = os.stat(path)
+    identity = (path, stat.st_size, stat.st_mtime_ns, byte_range)
+    with _file_hashes_lock:
+        digest = _file_hashes.get(identity)
+        if digest is not None:
+            _file_hashes.move_to_end(identity)
+    if digest is None:
+        start, end = byte_range or (0, None)
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(HASH_BUFFER_SIZE if remaining is None else min(HASH_BUFFER_SIZE, remaining))
+                if not chunk:
+                    break
+                sha.update(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+        digest = sha.hexdigest()
+        with _file_hashes_lock:
+            _file_hashes[identity] = digest
+            _file_hashes.move_to_end(identity)
+            while len(_file_hashes) > MAX_REMEMBERED_HASHES:
+                _file_hashes.popitem(last=False)
+    return digest
+
+class TranscriptCache:
+    """Persistent transcript cache with size-bounded LRU eviction and hit/miss counters.
+
+    Entries are JSON files named after a key built from the audio content hash,
+    the model and the transcription parameters; a hit refreshes the file mtime
+    and the oldest entries are removed once the directory exceeds max_bytes.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, audio_hash: str, **params: Any) -> str:
+        material = json.dumps({"v": CACHE_FORMAT_VERSION, "audio": audio_hash, **params},
+                              sort_keys=True, default=str)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                value = json.load(f)
+            os.utime(path)  # mark as recently used
+            self._count(hit=True)
+            return value
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable transcript cache entry {key}: {e}")
+            self.delete(key)
+        self._count(hit=False)
+        return None
+
+    def _count(self, hit: bool) -> None:
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write transcript cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "max_mb": self.max_bytes // (1024 * 1024)
+        }
+
+# Singleton instance
+transcript_cache = TranscriptCache(ASR_CACHE_DIR, ASR_CACHE_MAX_MB * 1024 * 1024, ASR_CACHE_ENABLED)
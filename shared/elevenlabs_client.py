@@ -3,6 +3,7 @@ import os
 import requests
 import logging
 from typing import List, Dict, Optional
+from http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -18,11 +19,12 @@ class ElevenLabsClient:
             'xi-api-key': self.api_key,
             'Content-Type': 'application/json'
         }
+        self.http = get_client('elevenlabs')
     
     def get_voices(self) -> List[Dict]:
         """Hole verfügbare Stimmen"""
         try:
-            response = requests.get(f"{self.base_url}/voices", headers=self.headers)
+            response = self.http.get(f"{self.base_url}/voices", headers=self.headers)
             response.raise_for_status()
             return response.json().get('voices', [])
         except requests.exceptions.RequestException as e:
@@ -35,7 +37,7 @@ class ElevenLabsClient:
             url = f"{self.base_url}/text-to-speech/{voice_id}/preview"
             data = {"text": text}
             
-            response = requests.post(url, json=data, headers=self.headers)
+            response = self.http.post(url, json=data, headers=self.headers)
             response.raise_for_status()
             return response.content
         except requests.exceptions.RequestException as e:
@@ -55,7 +57,7 @@ class ElevenLabsClient:
                 }
             }
             
-            response = requests.post(url, json=data, headers=self.headers)
+            response = self.http.post(url, json=data, headers=self.headers)
             response.raise_for_status()
             return response.content
         except requests.exceptions.RequestException as e:
@@ -0,0 +1,265 @@
+# shared/http_client.py
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Connections kept alive per upstream (and per worker process)
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '20'))
+# Consecutive failures after which an upstream is short-circuited, and for how long
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('HTTP_CIRCUIT_FAILURES', '5'))
+CIRCUIT_RESET_SECONDS = float(os.environ.get('HTTP_CIRCUIT_RESET_SECONDS', '30'))
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (502, 503, 504)
+# Only these are retried after the request may have reached the upstream;
+# connection errors are retried for every method
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+class UpstreamConfig:
+    """Timeouts (seconds) and retry budget for one upstream service"""
+    def __init__(self, connect_timeout: float, read_timeout: float, retries: int):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+
+    @classmethod
+    def from_env(cls, name: str, connect_timeout: float, read_timeout: float, retries: int) -> 'UpstreamConfig':
+        """Defaults, overridable via HTTP_<NAME>_TIMEOUT (read) and HTTP_<NAME>_RETRIES"""
+        prefix = f"HTTP_{name.upper()}_"
+        return cls(
+            connect_timeout,
+            float(os.environ.get(prefix + 'TIMEOUT', read_timeout)),
+            int(os.environ.get(prefix + 'RETRIES', retries))
+        )
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+    def timeout_for(self, media_seconds: Optional[float],
+                    seconds_per_media_second: float) -> Tuple[float, float]:
+        """Per-call timeout for work that scales with the media length (e.g. transcription):
+        the configured read timeout, or longer if the media needs it"""
+        read_timeout = self.read_timeout
+        if media_seconds:
+            read_timeout = max(read_timeout, media_seconds * seconds_per_media_second)
+        return (self.connect_timeout, read_timeout)
+
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    # Webhooks should answer quickly; a stalled n8n must not hold Flask workers
+    'n8n': UpstreamConfig.from_env('n8n', 3, 10, 2),
+    # Transcription and music generation legitimately take minutes
+    'whisper': UpstreamConfig.from_env('whisper', 3, 600, 1),
+    'musicgen': UpstreamConfig.from_env('musicgen', 3, 360, 0),
+    'elevenlabs': UpstreamConfig.from_env('elevenlabs', 5, 60, 2),
+    # Frontend/nginx: media downloads and status publishing
+    'frontend': UpstreamConfig.from_env('frontend', 3, 300, 2),
+    'default': UpstreamConfig.from_env('default', 5, 60, 1),
+}
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without a network call while an upstream is considered down"""
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and lets a single trial call
+    through once `reset_seconds` have passed (half-open)."""
+    def __init__(self, name: str, threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.threshold = max(1, threshold)
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                raise CircuitOpenError(f"Upstream '{self.name}' is unavailable (circuit open)")
+            # Half-open: this call is the trial, everyone else keeps failing fast
+            self.opened_at = time.monotonic()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit for upstream '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+def _is_failure(status_code: int) -> bool:
+    return status_code >= 500
+
+class _HostBreakers:
+    """One circuit breaker per host, so a single bad host (e.g. one download
+    source behind the 'default' client) does not short-circuit all the others"""
+    def __init__(self, name: str):
+        self.name = name
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc.lower()
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(host)
+                if breaker is None:
+                    breaker = self._breakers[host] = CircuitBreaker(f"{self.name} ({host})")
+        return breaker
+
+class UpstreamClient:
+    """requests.Session with keep-alive pooling, default timeouts, retries and a
+    circuit breaker for one upstream. Use the module-level get_client()."""
+    def __init__(self, name: str, config: UpstreamConfig):
+        self.name = name
+        self.config = config
+        self.breakers = _HostBreakers(name)
+        self.session = requests.Session()
+        retry = Retry(
+            total=config.retries,
+            connect=config.retries,
+            read=config.retries,
+            status=config.retries,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault('timeout', self.config.timeout)
+        breaker = self.breakers.for_url(url)
+        breaker.before_call()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            breaker.record_failure()
+            raise
+        if _is_failure(response.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+class AsyncUpstreamClient:
+    """httpx.AsyncClient counterpart of UpstreamClient for the FastAPI services.
+
+    Retries connection errors for every method and timeouts/5xx responses for
+    idempotent ones, with exponential backoff. A (connect, read) timeout tuple
+    is accepted per call, as with UpstreamClient. Use get_async_client().
+    """
+    def __init__(self, name: str, config: UpstreamConfig):
+        import httpx  # only the async services install httpx
+
+        self.name = name
+        self.config = config
+        self.breakers = _HostBreakers(name)
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+        )
+
+    async def request(self, method: str, url: str, **kwargs: Any):
+        httpx = self._httpx
+        if isinstance(kwargs.get('timeout'), tuple):
+            connect_timeout, read_timeout = kwargs['timeout']
+            kwargs['timeout'] = httpx.Timeout(read_timeout, connect=connect_timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        breaker = self.breakers.for_url(url)
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                retryable = isinstance(e, httpx.ConnectError) or idempotent
+                if not retryable or attempt >= self.config.retries:
+                    raise
+            else:
+                if not _is_failure(response.status_code):
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if not (idempotent and response.status_code in RETRY_STATUS_CODES) or attempt >= self.config.retries:
+                    return response
+                await response.aclose()
+            attempt += 1
+            await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+    async def get(self, url: str, **kwargs: Any):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any):
+        return await self.request('POST', url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+_clients: Dict[str, UpstreamClient] = {}
+_async_clients: Dict[str, AsyncUpstreamClient] = {}
+_clients_lock = threading.Lock()
+
+def _config(name: str) -> UpstreamConfig:
+    return UPSTREAMS.get(name) or UPSTREAMS['default']
+
+def get_client(name: str) -> UpstreamClient:
+    """Shared pooled client for an upstream ('n8n', 'whisper', 'musicgen', 'elevenlabs', ...)"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = UpstreamClient(name, _config(name))
+    return client
+
+def get_async_client(name: str) -> AsyncUpstreamClient:
+    """Shared async client for an upstream (create and use it inside the event loop)"""
+    client = _async_clients.get(name)
+    if client is None:
+        client = _async_clients[name] = AsyncUpstreamClient(name, _config(name))
+    return client
+
+async def close_async_clients() -> None:
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
@@ -0,0 +1,157 @@
+# shared/metadata_store.py
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# One SQLite file on the shared volume; every service uses its own table
+METADATA_DB_PATH = os.environ.get('METADATA_DB_PATH', '/app/videos/metadata/gencut.sqlite3')
+# Entries not updated for this long are removed
+METADATA_TTL_DAYS = float(os.environ.get('METADATA_TTL_DAYS', '30'))
+# Expired entries are purged at most this often per process
+PURGE_INTERVAL_SECONDS = 3600
+MAX_PAGE_SIZE = 500
+
+_TABLE_PATTERN = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+def _status_of(data: Any) -> Optional[str]:
+    """Status column value: the `status` field (n8n also sends a list of entries)"""
+    if isinstance(data, list) and data:
+        data = data[0]
+    if isinstance(data, dict) and data.get('status') is not None:
+        return str(data['status'])
+    return None
+
+class MetadataStore:
+    """Persistent per-video metadata (status, sessions) shared by all workers.
+
+    Entries are JSON documents keyed by video_id in a SQLite database in WAL mode,
+    so readers never block the writer and every Gunicorn worker (and service)
+    sees the same state. Lookups go through the primary key, listings through
+    the status/updated_at indexes; entries expire after ttl_seconds without update.
+    """
+    def __init__(self, table: str, db_path: str = METADATA_DB_PATH,
+                 ttl_seconds: float = METADATA_TTL_DAYS * 86400):
+        if not _TABLE_PATTERN.match(table):
+            raise ValueError(f"Invalid table name: {table}")
+        self.table = table
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self) -> None:
+        conn = self._connection()
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                video_id TEXT PRIMARY KEY,
+                status TEXT,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_status ON {self.table} (status, updated_at)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_updated ON {self.table} (updated_at)")
+
+    def get(self, video_id: str) -> Optional[Any]:
+        row = self._connection().execute(
+            f"SELECT data FROM {self.table} WHERE video_id = ? AND updated_at >= ?",
+            (video_id, time.time() - self.ttl_seconds)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, video_id: str, data: Any) -> None:
+        """Insert or replace the document of a video"""
+        now = time.time()
+        self._connection().execute(
+            f"""
+            INSERT INTO {self.table} (video_id, status, data, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(video_id) DO UPDATE SET
+                status = excluded.status, data = excluded.data, updated_at = excluded.updated_at
+            """,
+            (video_id, _status_of(data), json.dumps(data), now, now)
+        )
+        self._maybe_purge(now)
+
+    def update(self, video_id: str, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Merge `changes` into an existing (dict) document; returns it, or None if unknown or expired"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute(
+                f"SELECT data FROM {self.table} WHERE video_id = ? AND updated_at >= ?",
+                (video_id, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return None
+            data = {**json.loads(row[0]), **changes}
+            conn.execute(
+                f"UPDATE {self.table} SET status = ?, data = ?, updated_at = ? WHERE video_id = ?",
+                (_status_of(data), json.dumps(data), now, video_id)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return data
+
+    def delete(self, video_id: str) -> None:
+        self._connection().execute(f"DELETE FROM {self.table} WHERE video_id = ?", (video_id,))
+
+    def count(self, status: Optional[str] = None) -> int:
+        query = f"SELECT COUNT(*) FROM {self.table} WHERE updated_at >= ?"
+        params: List[Any] = [time.time() - self.ttl_seconds]
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        return self._connection().execute(query, params).fetchone()[0]
+
+    def list(self, limit: int = 50, offset: int = 0, status: Optional[str] = None) -> List[Any]:
+        """Documents ordered by last update (newest first), one page at a time"""
+        query = f"SELECT data FROM {self.table} WHERE updated_at >= ?"
+        params: List[Any] = [time.time() - self.ttl_seconds]
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY updated_at DESC LIMIT ? OFFSET ?"
+        params += [max(1, min(limit, MAX_PAGE_SIZE)), max(0, offset)]
+        return [json.loads(row[0]) for row in self._connection().execute(query, params)]
+
+    def purge_expired(self) -> int:
+        cursor = self._connection().execute(
+            f"DELETE FROM {self.table} WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        return cursor.rowcount
+
+    def _maybe_purge(self, now: float) -> None:
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        try:
+            removed = self.purge_expired()
+            if removed:
+                logger.info(f"Removed {removed} expired entries from {self.table}")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not purge {self.table}: {e}")
@@ -0,0 +1,211 @@
+# shared/resumable_upload.py
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Size of the pieces copied from the request stream to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+# Suggested chunk size for clients (one PUT per chunk)
+DEFAULT_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE_MB', '8')) * 1024 * 1024
+# Unfinished uploads older than this are removed together with their partial file
+SESSION_TTL_SECONDS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', '24')) * 3600
+
+_UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+class ResumableUploadError(Exception):
+    """Fehler im Upload-Protokoll, mit passendem HTTP-Statuscode"""
+    status_code = 400
+
+    def __init__(self, message: str, **details: Any):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'error': self.message, **self.details}
+
+class UploadNotFoundError(ResumableUploadError):
+    status_code = 404
+
+class UploadOffsetMismatchError(ResumableUploadError):
+    status_code = 409
+
+class UploadBusyError(ResumableUploadError):
+    status_code = 409
+
+class UploadIncompleteError(ResumableUploadError):
+    status_code = 409
+
+class UploadTooLargeError(ResumableUploadError):
+    status_code = 413
+
+class ResumableUploadStore:
+    """Resumable uploads written in place to their final location.
+
+    Protocol: create() a session with the total size, then write_chunk() at the
+    current offset until the file is complete, and finalize() it; the session is
+    only removed with complete() once the upload has been handed on. The offset is
+    the size of the file on disk, so it survives dropped connections, worker
+    restarts and requests landing on another Gunicorn worker. Session metadata is
+    kept as JSON in `sessions_dir`, which must be shared by all workers and must not
+    be served by the web server (it lies outside the public upload folder).
+    """
+    def __init__(self, upload_folder: str, max_size: int, sessions_dir: str):
+        self.upload_folder = upload_folder
+        self.max_size = max_size
+        self.sessions_dir = sessions_dir
+        os.makedirs(self.sessions_dir, exist_ok=True)
+
+    def _session_path(self, upload_id: str) -> str:
+        if not _UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadNotFoundError('Unknown upload', upload_id=upload_id)
+        return os.path.join(self.sessions_dir, f"{upload_id}.json")
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._session_path(upload_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadNotFoundError('Unknown upload', upload_id=upload_id)
+
+    def _save(self, session: Dict[str, Any]) -> None:
+        path = self._session_path(session['upload_id'])
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _offset(session: Dict[str, Any]) -> int:
+        try:
+            return os.path.getsize(session['filepath'])
+        except OSError:
+            return 0
+
+    def _with_offset(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        return {**session, 'offset': self._offset(session), 'chunk_size': DEFAULT_CHUNK_SIZE}
+
+    def create(self, upload_id: str, filename: str, total_size: int,
+               metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Start an upload of total_size bytes to upload_folder/filename"""
+        if total_size <= 0:
+            raise ResumableUploadError('Upload size must be positive')
+        if total_size > self.max_size:
+            raise UploadTooLargeError('File too large', max_size=self.max_size)
+        self.cleanup_expired()
+
+        filepath = os.path.join(self.upload_folder, filename)
+        # Create the (empty) target file right away; chunks are appended to it in place
+        open(filepath, 'wb').close()
+        session = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'filepath': filepath,
+            'size': total_size,
+            'metadata': metadata or {},
+            'created_at': time.time()
+        }
+        self._save(session)
+        return self._with_offset(session)
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        return self._with_offset(self._load(upload_id))
+
+    def write_chunk(self, upload_id: str, offset: int, stream: BinaryIO,
+                    length: Optional[int] = None) -> Dict[str, Any]:
+        """Append the bytes of `stream` at `offset`, which must be the current file size.
+
+        Everything received is kept even if the connection drops mid-chunk; the
+        client then asks for the offset and continues from there.
+        """
+        session = self._load(upload_id)
+        with open(session['filepath'], 'r+b') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadBusyError('Another chunk is being written', upload_id=upload_id)
+            try:
+                current = os.fstat(f.fileno()).st_size
+                if offset != current:
+                    raise UploadOffsetMismatchError('Offset does not match', offset=current)
+                if length is not None and current + length > session['size']:
+                    raise UploadTooLargeError('Chunk exceeds declared upload size', offset=current)
+
+                f.seek(current)
+                remaining = session['size'] - current
+                while remaining > 0:
+                    piece = stream.read(min(COPY_BUFFER_SIZE, remaining))
+                    if not piece:
+                        break
+                    f.write(piece)
+                    remaining -= len(piece)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        # Activity keeps the session from expiring
+        os.utime(self._session_path(upload_id))
+        return self._with_offset(session)
+
+    @contextmanager
+    def finalize(self, upload_id: str) -> Iterator[Dict[str, Any]]:
+        """Hold a complete upload while it is handed on; yields its session.
+
+        The caller calls complete() inside the block once the hand-off (e.g. the
+        webhook) succeeded. Otherwise the session is kept, so the client can retry
+        finalize for the fully uploaded file. Concurrent finalize calls for the same
+        upload get UploadBusyError, so the hand-off never runs twice at once.
+        """
+        try:
+            session_file = open(self._session_path(upload_id), 'r')
+        except OSError:
+            raise UploadNotFoundError('Unknown upload', upload_id=upload_id)
+        with session_file:
+            try:
+                fcntl.flock(session_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadBusyError('Upload is being finalized', upload_id=upload_id)
+            try:
+                # Re-read under the lock: a finalize that just finished has removed the session
+                session = self._with_offset(self._load(upload_id))
+                if session['offset'] != session['size']:
+                    raise UploadIncompleteError('Upload is not complete',
+                                                offset=session['offset'], size=session['size'])
+                # Retries keep the session from expiring
+                os.utime(self._session_path(upload_id))
+                yield session
+            finally:
+                fcntl.flock(session_file, fcntl.LOCK_UN)
+
+    def complete(self, upload_id: str) -> None:
+        """Remove the session of a finalized upload (the file stays where it is)"""
+        try:
+            os.remove(self._session_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def cleanup_expired(self) -> None:
+        """Remove sessions (and partial files) of uploads abandoned for longer than the TTL"""
+        now = time.time()
+        for name in os.listdir(self.sessions_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.sessions_dir, name)
+            try:
+                if now - os.path.getmtime(path) < SESSION_TTL_SECONDS:
+                    continue
+                with open(path, 'r') as f:
+                    session = json.load(f)
+                if os.path.exists(session['filepath']):
+                    os.remove(session['filepath'])
+                os.remove(path)
+                logger.info(f"Removed expired upload {session['upload_id']}")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not clean up upload session {name}: {e}")